@@ -0,0 +1,276 @@
+"""流式热路径压测
+
+覆盖每个 token 都会经过的路径：
+    上游 JSON 数组流解析 -> replies 文本提取 -> SSE 数据块编码
+
+对每个解析器 / 编码器输出 objects/s、bytes/s、单块 p50/p99 延迟和峰值内存。
+
+用法（在仓库根目录执行）：
+    python -m benchmarks.bench_stream_pipeline
+    python -m benchmarks.bench_stream_pipeline --scenario long_reasoning --iterations 50
+    python -m benchmarks.bench_stream_pipeline --payload captured_response.json --json
+"""
+import argparse
+import codecs
+import json
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from benchmarks.payloads import SCENARIOS, load_recorded, split_chunks
+from util.sse import ChunkEncoder, create_chunk
+from util.streaming_parser import parse_json_array_bytes_stream, parse_json_array_stream
+
+CHAT_ID = "chatcmpl-00000000-0000-0000-0000-000000000000"
+CREATED = 1700000000
+MODEL = "gemini-2.5-pro"
+
+
+# ---------- 解析器 ----------
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """与 httpx.Response.aiter_lines() 相同的解码 + 分行方式"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        lines = text.splitlines(keepends=True)
+        pending = ""
+        if lines and not lines[-1].endswith(("\n", "\r")):
+            pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r\n")
+    text = pending + decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def _parse_lines(chunks: Iterable[bytes]) -> Iterator[dict]:
+    return parse_json_array_stream(_iter_lines(chunks))
+
+
+def _parse_bytes(chunks: Iterable[bytes]) -> Iterator[dict]:
+    return parse_json_array_bytes_stream(chunks)
+
+
+PARSERS: Dict[str, Callable[[Iterable[bytes]], Iterator[dict]]] = {
+    "lines": _parse_lines,
+    "bytes": _parse_bytes,
+}
+
+
+# ---------- 编码器 ----------
+# 每个工厂按响应构造一次，返回 (delta, finish_reason) -> SSE 行
+
+def _json_dumps_encoder(chat_id: str, created: int, model: str):
+    def encode(delta: dict, finish_reason: Optional[str]) -> str:
+        return f"data: {create_chunk(chat_id, created, model, delta, finish_reason)}\n\n"
+    return encode
+
+
+def _template_encoder(chat_id: str, created: int, model: str):
+    return ChunkEncoder(chat_id, created, model).encode
+
+
+ENCODERS: Dict[str, Callable] = {
+    "json_dumps": _json_dumps_encoder,
+    "template": _template_encoder,
+}
+
+
+# ---------- 测量 ----------
+
+def _extract_deltas(obj: dict) -> List[dict]:
+    """与 stream_chat_generator 中的 replies 循环保持一致"""
+    deltas = []
+    for reply in (
+        obj.get("streamAssistResponse", {})
+        .get("answer", {})
+        .get("replies", [])
+    ):
+        content_obj = reply.get("groundedContent", {}).get("content", {})
+        text = content_obj.get("text", "")
+        if not text:
+            continue
+        if content_obj.get("thought"):
+            deltas.append({"reasoning_content": text})
+        else:
+            deltas.append({"content": text})
+    return deltas
+
+
+def _timed(items: Iterable, marks: List[float]) -> Iterator:
+    """每次取下一项时打点；相邻打点之差即上一项的处理耗时"""
+    for item in items:
+        marks.append(time.perf_counter())
+        yield item
+    marks.append(time.perf_counter())
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _summarize(
+    stage: str,
+    impl: str,
+    scenario: str,
+    objects: int,
+    nbytes: int,
+    elapsed: float,
+    latencies: List[float],
+    peak_bytes: int,
+) -> dict:
+    return {
+        "stage": stage,
+        "impl": impl,
+        "scenario": scenario,
+        "objects_per_sec": objects / elapsed if elapsed else 0.0,
+        "bytes_per_sec": nbytes / elapsed if elapsed else 0.0,
+        "p50_us": _percentile(latencies, 50) * 1e6,
+        "p99_us": _percentile(latencies, 99) * 1e6,
+        "peak_kib": peak_bytes / 1024,
+    }
+
+
+def _peak_memory(run: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench_parser(name: str, scenario: str, chunks: List[bytes], iterations: int) -> dict:
+    parser = PARSERS[name]
+    nbytes = sum(len(c) for c in chunks)
+    latencies: List[float] = []
+    objects = 0
+    elapsed = 0.0
+    for _ in range(iterations):
+        marks: List[float] = []
+        start = time.perf_counter()
+        for _obj in parser(_timed(chunks, marks)):
+            objects += 1
+        elapsed += time.perf_counter() - start
+        latencies.extend(b - a for a, b in zip(marks, marks[1:]))
+    peak = _peak_memory(lambda: sum(1 for _ in parser(iter(chunks))))
+    return _summarize("parse", name, scenario, objects, nbytes * iterations, elapsed, latencies, peak)
+
+
+def bench_encoder(name: str, scenario: str, deltas: List[dict], iterations: int) -> dict:
+    factory = ENCODERS[name]
+    latencies: List[float] = []
+    nbytes = 0
+    elapsed = 0.0
+    for _ in range(iterations):
+        encode = factory(CHAT_ID, CREATED, MODEL)
+        start = time.perf_counter()
+        for delta in deltas:
+            t0 = time.perf_counter()
+            nbytes += len(encode(delta, None))
+            latencies.append(time.perf_counter() - t0)
+        elapsed += time.perf_counter() - start
+
+    def _run_once():
+        encode = factory(CHAT_ID, CREATED, MODEL)
+        return [encode(delta, None) for delta in deltas]
+
+    peak = _peak_memory(_run_once)
+    return _summarize("encode", name, scenario, len(deltas) * iterations, nbytes, elapsed, latencies, peak)
+
+
+def bench_pipeline(
+    parser_name: str,
+    encoder_name: str,
+    scenario: str,
+    chunks: List[bytes],
+    iterations: int,
+) -> dict:
+    parser = PARSERS[parser_name]
+    factory = ENCODERS[encoder_name]
+
+    def _run(source: Iterable[bytes]) -> Tuple[int, int]:
+        encode = factory(CHAT_ID, CREATED, MODEL)
+        frames = 0
+        out_bytes = 0
+        for obj in parser(source):
+            for delta in _extract_deltas(obj):
+                out_bytes += len(encode(delta, None))
+                frames += 1
+        return frames, out_bytes
+
+    nbytes = sum(len(c) for c in chunks)
+    latencies: List[float] = []
+    frames = 0
+    elapsed = 0.0
+    for _ in range(iterations):
+        marks: List[float] = []
+        start = time.perf_counter()
+        count, _ = _run(_timed(chunks, marks))
+        elapsed += time.perf_counter() - start
+        frames += count
+        latencies.extend(b - a for a, b in zip(marks, marks[1:]))
+    peak = _peak_memory(lambda: _run(iter(chunks)))
+    return _summarize(
+        "pipeline", f"{parser_name}+{encoder_name}", scenario, frames, nbytes * iterations, elapsed, latencies, peak
+    )
+
+
+def run(scenarios: Dict[str, bytes], chunk_size: int, iterations: int) -> List[dict]:
+    results = []
+    for scenario, payload in scenarios.items():
+        chunks = split_chunks(payload, chunk_size)
+        deltas = [d for obj in parse_json_array_bytes_stream(chunks) for d in _extract_deltas(obj)]
+        for name in PARSERS:
+            results.append(bench_parser(name, scenario, chunks, iterations))
+        for name in ENCODERS:
+            results.append(bench_encoder(name, scenario, deltas, iterations))
+        for parser_name in PARSERS:
+            for encoder_name in ENCODERS:
+                results.append(bench_pipeline(parser_name, encoder_name, scenario, chunks, iterations))
+    return results
+
+
+def _print_table(results: List[dict]) -> None:
+    header = f"{'stage':<9} {'impl':<22} {'scenario':<17} {'objs/s':>12} {'MB/s':>9} {'p50 us':>9} {'p99 us':>9} {'peak KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['stage']:<9} {r['impl']:<22} {r['scenario']:<17} "
+            f"{r['objects_per_sec']:>12,.0f} {r['bytes_per_sec'] / 1e6:>9.2f} "
+            f"{r['p50_us']:>9.1f} {r['p99_us']:>9.1f} {r['peak_kib']:>10.1f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark upstream stream parsing and SSE encoding")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="可重复指定，默认全部")
+    parser.add_argument("--payload", help="抓包保存的 widgetStreamAssist 原始响应体")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="模拟网络读取的字节块大小")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    names = args.scenario or ([] if args.payload else list(SCENARIOS))
+    scenarios = {name: SCENARIOS[name]() for name in names}
+    if args.payload:
+        scenarios["recorded"] = load_recorded(args.payload)
+
+    results = run(scenarios, args.chunk_size, args.iterations)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Gemini Business 模拟上游（离线压测用）
+
+实现网关用到的全部上游接口：
+    GET  /auth/getoxsrf
+    POST /v1alpha/locations/global/widgetCreateSession
+    POST /v1alpha/locations/global/widgetAddContextFile
+    POST /v1alpha/locations/global/widgetStreamAssist
+    POST /v1alpha/locations/global/widgetListSessionFileMetadata
+    GET  /v1alpha/{session}:downloadFile
+
+流式输出的 token 速率、首包延迟、故障注入（401/429/5xx）均可通过命令行设置，
+运行中也可以用 POST /__fake/config 动态修改（GET 查看当前配置与计数）。
+
+用法：
+    python -m benchmarks.fake_upstream --port 8081 --token-rate 50 --first-token-ms 300
+    python -m benchmarks.fake_upstream --print-accounts 20 > accounts.json
+
+网关侧设置：
+    GEMINI_API_BASE=http://127.0.0.1:8081/v1alpha
+    GEMINI_AUTH_BASE=http://127.0.0.1:8081
+    ACCOUNTS_CONFIG="$(cat accounts.json)"
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import uuid
+from collections import Counter
+from typing import Optional
+
+from fastapi import Body, FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from benchmarks.payloads import WORDS
+
+SESSION_PREFIX = "projects/000000000000/locations/global/collections/default_collection/engines/agentspace-engine/sessions/"
+
+# 1x1 透明 PNG
+PNG_BYTES = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+FAULT_STATUS = {"fault_401": 401, "fault_429": 429, "fault_5xx": 503}
+
+# 运行时配置（可通过 /__fake/config 修改）
+settings = {
+    "token_rate": 50.0,  # 每秒输出的 token（回复片段）数，0 表示不限速
+    "tokens": 200,  # 每次回答的 token 数
+    "words_per_token": 3,
+    "thought_tokens": 0,  # 正文之前的思考片段数
+    "first_token_ms": 300,  # 首个 token 前的延迟
+    "api_latency_ms": 20,  # 非流式接口的处理延迟
+    "images": 1,  # 图片生成请求返回的图片数
+    "fault_401": 0.0,  # 各类故障的注入概率（0~1）
+    "fault_429": 0.0,
+    "fault_5xx": 0.0,
+    "fault_endpoints": [],  # 为空表示对所有接口注入
+}
+counters: Counter = Counter()
+
+app = FastAPI(title="Fake Gemini Business upstream")
+
+
+def _inject_fault(endpoint: str) -> Optional[Response]:
+    targets = settings["fault_endpoints"]
+    if targets and endpoint not in targets:
+        return None
+    for key, status in FAULT_STATUS.items():
+        if settings[key] and random.random() < settings[key]:
+            counters[f"{endpoint}:{status}"] += 1
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"code": status, "message": f"injected {status}"}},
+            )
+    return None
+
+
+async def _api_latency() -> None:
+    if settings["api_latency_ms"]:
+        await asyncio.sleep(settings["api_latency_ms"] / 1000)
+
+
+def _file_ids(session: str) -> list:
+    session_id = session.rsplit("/", 1)[-1]
+    return [f"gen_{session_id}_{i}" for i in range(int(settings["images"]))]
+
+
+@app.get("/auth/getoxsrf")
+async def getoxsrf(csesidx: str = ""):
+    counters["getoxsrf"] += 1
+    fault = _inject_fault("getoxsrf")
+    if fault:
+        return fault
+    await _api_latency()
+    payload = {
+        "xsrfToken": base64.urlsafe_b64encode(os.urandom(32)).decode().rstrip("="),
+        "keyId": f"fake-key-{csesidx or 'default'}",
+    }
+    return Response(")]}'\n" + json.dumps(payload), media_type="application/json")
+
+
+@app.post("/v1alpha/locations/global/widgetCreateSession")
+async def create_session(body: dict = Body(default=None)):
+    counters["widgetCreateSession"] += 1
+    fault = _inject_fault("widgetCreateSession")
+    if fault:
+        return fault
+    await _api_latency()
+    return {"session": {"name": f"{SESSION_PREFIX}{uuid.uuid4().int % 10**19}"}}
+
+
+@app.post("/v1alpha/locations/global/widgetAddContextFile")
+async def add_context_file(body: dict = Body(default=None)):
+    counters["widgetAddContextFile"] += 1
+    fault = _inject_fault("widgetAddContextFile")
+    if fault:
+        return fault
+    await _api_latency()
+    return {"addContextFileResponse": {"fileId": f"ctx_{uuid.uuid4().hex[:16]}"}}
+
+
+@app.post("/v1alpha/locations/global/widgetListSessionFileMetadata")
+async def list_session_file_metadata(body: dict = Body(default=None)):
+    counters["widgetListSessionFileMetadata"] += 1
+    fault = _inject_fault("widgetListSessionFileMetadata")
+    if fault:
+        return fault
+    await _api_latency()
+    session = ((body or {}).get("listSessionFileMetadataRequest") or {}).get("name", "")
+    metadata = [
+        {"fileId": fid, "mimeType": "image/png", "session": session}
+        for fid in _file_ids(session)
+    ]
+    return {"listSessionFileMetadataResponse": {"fileMetadata": metadata}}
+
+
+@app.get("/v1alpha/{resource:path}")
+async def download_file(resource: str, fileId: str = ""):
+    if not resource.endswith(":downloadFile"):
+        return JSONResponse(status_code=404, content={"error": {"code": 404}})
+    counters["downloadFile"] += 1
+    fault = _inject_fault("downloadFile")
+    if fault:
+        return fault
+    await _api_latency()
+    return Response(PNG_BYTES, media_type="image/png")
+
+
+def _event(session: str, content: Optional[dict] = None, state: str = "IN_PROGRESS") -> dict:
+    answer: dict = {"state": state}
+    if content is not None:
+        answer["replies"] = [{"groundedContent": {"content": content}}]
+    return {"streamAssistResponse": {"answer": answer, "sessionInfo": {"session": session}}}
+
+
+async def _stream_events(session: str, wants_image: bool):
+    rng = random.Random()
+    interval = 1 / settings["token_rate"] if settings["token_rate"] else 0
+    words = int(settings["words_per_token"])
+
+    def token() -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(words)) + " "
+
+    yield "["
+    await asyncio.sleep(settings["first_token_ms"] / 1000)
+    first = True
+    events = [_event(session, {"text": token(), "thought": True}) for _ in range(int(settings["thought_tokens"]))]
+    for event in events:
+        yield ("" if first else ",") + json.dumps(event, ensure_ascii=False, indent=2)
+        first = False
+        if interval:
+            await asyncio.sleep(interval)
+    for _ in range(int(settings["tokens"])):
+        yield ("" if first else ",") + json.dumps(_event(session, {"text": token()}), ensure_ascii=False, indent=2)
+        first = False
+        if interval:
+            await asyncio.sleep(interval)
+    if wants_image:
+        for fid in _file_ids(session):
+            yield "," + json.dumps(_event(session, {"file": {"fileId": fid, "mimeType": "image/png"}}), indent=2)
+    yield "," + json.dumps(_event(session, state="SUCCEEDED"), indent=2)
+    yield "]"
+
+
+@app.post("/v1alpha/locations/global/widgetStreamAssist")
+async def stream_assist(body: dict = Body(default=None)):
+    counters["widgetStreamAssist"] += 1
+    fault = _inject_fault("widgetStreamAssist")
+    if fault:
+        return fault
+    request = (body or {}).get("streamAssistRequest") or {}
+    session = request.get("session") or f"{SESSION_PREFIX}0"
+    tools = request.get("toolsSpec") or {}
+    wants_image = "imageGenerationSpec" in tools and "webGroundingSpec" not in tools
+    return StreamingResponse(_stream_events(session, wants_image), media_type="application/json")
+
+
+@app.get("/__fake/config")
+async def get_config():
+    return {"settings": settings, "counters": dict(counters)}
+
+
+@app.post("/__fake/config")
+async def update_config(request: Request):
+    updates = await request.json()
+    for key, value in (updates or {}).items():
+        if key in settings:
+            settings[key] = value
+    if updates.get("reset_counters"):
+        counters.clear()
+    return {"settings": settings}
+
+
+def build_accounts(count: int) -> list:
+    """生成指向模拟上游的假账户配置"""
+    return [
+        {
+            "id": f"fake_{i:04d}",
+            "secure_c_ses": f"fake-ses-{i}",
+            "csesidx": str(100000 + i),
+            "config_id": f"fake-config-{i}",
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Gemini Business upstream for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token-rate", type=float, default=settings["token_rate"])
+    parser.add_argument("--tokens", type=int, default=settings["tokens"])
+    parser.add_argument("--thought-tokens", type=int, default=settings["thought_tokens"])
+    parser.add_argument("--first-token-ms", type=int, default=settings["first_token_ms"])
+    parser.add_argument("--api-latency-ms", type=int, default=settings["api_latency_ms"])
+    parser.add_argument("--fault-401", type=float, default=0.0)
+    parser.add_argument("--fault-429", type=float, default=0.0)
+    parser.add_argument("--fault-5xx", type=float, default=0.0)
+    parser.add_argument("--fault-endpoint", action="append", default=[], help="只对指定接口注入故障，可重复")
+    parser.add_argument("--print-accounts", type=int, metavar="N", help="输出 N 个假账户的 ACCOUNTS_CONFIG 后退出")
+    args = parser.parse_args()
+
+    if args.print_accounts:
+        print(json.dumps(build_accounts(args.print_accounts)))
+        return
+
+    settings.update(
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        thought_tokens=args.thought_tokens,
+        first_token_ms=args.first_token_ms,
+        api_latency_ms=args.api_latency_ms,
+        fault_401=args.fault_401,
+        fault_429=args.fault_429,
+        fault_5xx=args.fault_5xx,
+        fault_endpoints=args.fault_endpoint,
+    )
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""/v1/chat/completions 端到端压测
+
+对运行中的网关发起固定并发的流式对话，统计每档并发下的 requests/s、
+TTFB（首字节，通常是 ": init" 注释帧）、TTFT（首个正文 token）和总耗时的分位数。
+
+配合 benchmarks/fake_upstream.py 可在完全离线的环境下压测网关自身的吞吐：
+    python -m benchmarks.fake_upstream --port 8081 --print-accounts 50 > /tmp/accounts.json
+    python -m benchmarks.fake_upstream --port 8081 --token-rate 50 &
+    GEMINI_API_BASE=http://127.0.0.1:8081/v1alpha GEMINI_AUTH_BASE=http://127.0.0.1:8081 \\
+        ACCOUNTS_CONFIG="$(cat /tmp/accounts.json)" ADMIN_KEY=x python main.py &
+    python -m benchmarks.load_test --url http://127.0.0.1:7860 --concurrency 100,500,1000,2000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import List, Optional
+
+import httpx
+
+
+class Sample:
+    __slots__ = ("ok", "status", "ttfb", "ttft", "total", "error")
+
+    def __init__(self) -> None:
+        self.ok = False
+        self.status: Optional[int] = None
+        self.ttfb: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.total: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+async def _one_request(client: httpx.AsyncClient, url: str, api_key: str, model: str, prompt: str) -> Sample:
+    sample = Sample()
+    headers = {"content-type": "application/json"}
+    if api_key:
+        headers["authorization"] = f"Bearer {api_key}"
+    body = {
+        "model": model,
+        "stream": True,
+        # 每个请求使用不同的开场消息，避免命中同一会话锁
+        "messages": [{"role": "user", "content": f"{prompt} [{uuid.uuid4().hex[:8]}]"}],
+    }
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", url, headers=headers, json=body) as resp:
+            sample.status = resp.status_code
+            async for line in resp.aiter_lines():
+                now = time.perf_counter()
+                if sample.ttfb is None:
+                    sample.ttfb = now - start
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    # 继续读到连接结束，避免网关把提前断开记为客户端取消
+                    sample.ok = resp.status_code == 200 and sample.error is None
+                    continue
+                if sample.ttft is None and '"content"' in data:
+                    sample.ttft = now - start
+                if '"error"' in data:
+                    try:
+                        sample.error = json.loads(data).get("error", {}).get("message")
+                    except ValueError:
+                        sample.error = data[:100]
+    except Exception as e:
+        sample.error = f"{type(e).__name__}: {str(e)[:100]}"
+    sample.total = time.perf_counter() - start
+    if not sample.ok and sample.error is None:
+        sample.error = f"HTTP {sample.status}"
+    return sample
+
+
+async def run_level(
+    base_url: str,
+    concurrency: int,
+    requests_per_worker: int,
+    api_key: str,
+    model: str,
+    prompt: str,
+    timeout: float,
+) -> dict:
+    url = f"{base_url.rstrip('/')}/v1/chat/completions"
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    samples: List[Sample] = []
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout), limits=limits) as client:
+        async def worker() -> None:
+            for _ in range(requests_per_worker):
+                samples.append(await _one_request(client, url, api_key, model, prompt))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    ok = [s for s in samples if s.ok]
+    errors: dict = {}
+    for s in samples:
+        if not s.ok:
+            errors[s.error] = errors.get(s.error, 0) + 1
+
+    def stats(values: List[float]) -> dict:
+        return {
+            "p50_ms": _percentile(values, 50) * 1000,
+            "p90_ms": _percentile(values, 90) * 1000,
+            "p99_ms": _percentile(values, 99) * 1000,
+            "max_ms": max(values) * 1000 if values else 0.0,
+        }
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "ok": len(ok),
+        "failed": len(samples) - len(ok),
+        "elapsed_s": elapsed,
+        "requests_per_sec": len(ok) / elapsed if elapsed else 0.0,
+        "ttfb": stats([s.ttfb for s in ok if s.ttfb is not None]),
+        "ttft": stats([s.ttft for s in ok if s.ttft is not None]),
+        "total": stats([s.total for s in ok if s.total is not None]),
+        "errors": errors,
+    }
+
+
+def _print_level(result: dict) -> None:
+    print(
+        f"concurrency={result['concurrency']} requests={result['requests']} "
+        f"ok={result['ok']} failed={result['failed']} "
+        f"rps={result['requests_per_sec']:.1f} elapsed={result['elapsed_s']:.1f}s"
+    )
+    for key in ("ttfb", "ttft", "total"):
+        s = result[key]
+        print(
+            f"  {key:<5} p50={s['p50_ms']:8.1f}ms p90={s['p90_ms']:8.1f}ms "
+            f"p99={s['p99_ms']:8.1f}ms max={s['max_ms']:8.1f}ms"
+        )
+    for error, count in sorted(result["errors"].items(), key=lambda x: -x[1])[:5]:
+        print(f"  error x{count}: {error}")
+
+
+async def _main(args: argparse.Namespace) -> None:
+    results = []
+    for level in [int(x) for x in args.concurrency.split(",") if x.strip()]:
+        result = await run_level(
+            args.url, level, args.requests_per_worker, args.api_key, args.model, args.prompt, args.timeout
+        )
+        results.append(result)
+        if not args.json:
+            _print_level(result)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test /v1/chat/completions with concurrent streams")
+    parser.add_argument("--url", default="http://127.0.0.1:7860", help="网关地址")
+    parser.add_argument("--concurrency", default="100,500,1000,2000", help="逗号分隔的并发档位")
+    parser.add_argument("--requests-per-worker", type=int, default=3)
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--prompt", default="hello")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
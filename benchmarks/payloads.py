@@ -0,0 +1,112 @@
+"""widgetStreamAssist 响应样本
+
+生成与上游格式一致的合成数据（带缩进的 JSON 数组），也可以加载抓包保存的原始响应体。
+"""
+import json
+import random
+from typing import Dict, List
+
+SESSION_NAME = "projects/000000000000/locations/global/collections/default_collection/engines/agentspace-engine/sessions/1234567890123456789"
+
+WORDS = (
+    "the gateway streams upstream replies as OpenAI compatible chunks while "
+    "keeping the session bound to one account 我们 需要 保证 首包 延迟 稳定 "
+    "并且 在 长 回答 中 保持 内存 平稳 {json} \"quoted\" back\\slash"
+).split(" ")
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + " "
+
+
+def _reply_event(text: str, thought: bool = False) -> dict:
+    content: Dict[str, object] = {"text": text}
+    if thought:
+        content["thought"] = True
+    return {
+        "streamAssistResponse": {
+            "answer": {
+                "state": "IN_PROGRESS",
+                "replies": [{"groundedContent": {"content": content}}],
+            },
+            "sessionInfo": {"session": SESSION_NAME},
+        }
+    }
+
+
+def _file_event(file_id: str, mime: str = "image/png") -> dict:
+    return {
+        "streamAssistResponse": {
+            "answer": {
+                "state": "IN_PROGRESS",
+                "replies": [
+                    {
+                        "groundedContent": {
+                            "content": {
+                                "file": {"fileId": file_id, "mimeType": mime},
+                            }
+                        }
+                    }
+                ],
+            },
+            "sessionInfo": {"session": SESSION_NAME},
+        }
+    }
+
+
+def _final_event() -> dict:
+    return {
+        "streamAssistResponse": {
+            "answer": {"state": "SUCCEEDED"},
+            "sessionInfo": {"session": SESSION_NAME},
+        }
+    }
+
+
+def _encode(events: List[dict]) -> bytes:
+    # 上游返回的是带缩进的 JSON 数组
+    return json.dumps(events, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def short_chat(seed: int = 1) -> bytes:
+    """短对话：20 个左右的增量文本"""
+    rng = random.Random(seed)
+    events = [_reply_event(_text(rng, rng.randint(2, 6))) for _ in range(20)]
+    events.append(_final_event())
+    return _encode(events)
+
+
+def long_reasoning(seed: int = 2) -> bytes:
+    """长推理输出：约 600 个思考片段 + 2400 个正文片段"""
+    rng = random.Random(seed)
+    events = [_reply_event(_text(rng, rng.randint(3, 12)), thought=True) for _ in range(600)]
+    events.extend(_reply_event(_text(rng, rng.randint(2, 8))) for _ in range(2400))
+    events.append(_final_event())
+    return _encode(events)
+
+
+def image_generation(seed: int = 3) -> bytes:
+    """图片生成：少量说明文本 + 带 file 引用的事件"""
+    rng = random.Random(seed)
+    events = [_reply_event(_text(rng, rng.randint(2, 6))) for _ in range(8)]
+    events.extend(_file_event(f"file_{i:04d}_{rng.getrandbits(48):012x}") for i in range(4))
+    events.append(_final_event())
+    return _encode(events)
+
+
+SCENARIOS = {
+    "short_chat": short_chat,
+    "long_reasoning": long_reasoning,
+    "image_generation": image_generation,
+}
+
+
+def load_recorded(path: str) -> bytes:
+    """加载抓包保存的 widgetStreamAssist 原始响应体"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def split_chunks(payload: bytes, chunk_size: int) -> List[bytes]:
+    """按固定大小切分，模拟网络读到的字节块"""
+    return [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
@@ -6,17 +6,17 @@ import asyncio
 import json
 import logging
 import os
-import random
-import threading
 import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, TYPE_CHECKING
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
 
 from fastapi import HTTPException
 
 # 导入存储层（支持数据库）
 from core import storage
+from core.scheduler import AccountScheduler
+from core.session_cache import SessionCache, SessionLockTable
 
 if TYPE_CHECKING:
     from core.jwt import JWTManager
@@ -38,6 +38,26 @@ QUOTA_TYPES = {
     "videos": "视频"
 }
 
+# 延迟 EWMA 平滑系数；超过该时长没有新样本的估计视为失效（让慢账户有机会被重新探测）
+LATENCY_EWMA_ALPHA = 0.3
+LATENCY_SAMPLE_TTL_SECONDS = 300
+
+# 账户过期时间格式（北京时间）
+EXPIRES_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def parse_expires_at(expires_at: Optional[str]) -> Optional[float]:
+    """把过期时间字符串（北京时间）解析为时间戳，未设置或格式错误时返回 None"""
+    if not expires_at:
+        return None
+    try:
+        expire_time = datetime.strptime(expires_at, EXPIRES_AT_FORMAT)
+        return expire_time.replace(tzinfo=BEIJING_TZ).timestamp()
+    except Exception:
+        return None
+
+
 # 配置文件路径 - 自动检测环境
 if os.path.exists("/data"):
     ACCOUNTS_FILE = "/data/accounts.json"  # HF Pro 持久化
@@ -61,32 +81,28 @@ class AccountConfig:
     mail_client_id: Optional[str] = None
     mail_refresh_token: Optional[str] = None
     mail_tenant: Optional[str] = None
+    weight: int = 1  # 调度权重（weighted 策略）
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # expires_at 赋值时（含初始化）解析一次，之后的过期判断只做浮点比较
+        if name == "expires_at":
+            super().__setattr__("_expires_ts", parse_expires_at(value))
+
+    @property
+    def expires_ts(self) -> Optional[float]:
+        """过期时间戳（未设置或格式错误时为 None）"""
+        return self._expires_ts
 
     def get_remaining_hours(self) -> Optional[float]:
         """计算账户剩余小时数"""
-        if not self.expires_at:
-            return None
-        try:
-            # 解析过期时间（假设为北京时间）
-            beijing_tz = timezone(timedelta(hours=8))
-            expire_time = datetime.strptime(self.expires_at, "%Y-%m-%d %H:%M:%S")
-            expire_time = expire_time.replace(tzinfo=beijing_tz)
-
-            # 当前时间（北京时间）
-            now = datetime.now(beijing_tz)
-
-            # 计算剩余时间
-            remaining = (expire_time - now).total_seconds() / 3600
-            return remaining
-        except Exception:
+        if self._expires_ts is None:
             return None
+        return (self._expires_ts - time.time()) / 3600
 
     def is_expired(self) -> bool:
-        """检查账户是否已过期"""
-        remaining = self.get_remaining_hours()
-        if remaining is None:
-            return False  # 未设置过期时间，默认不过期
-        return remaining <= 0
+        """检查账户是否已过期（未设置过期时间时默认不过期）"""
+        return self._expires_ts is not None and self._expires_ts <= time.time()
 
 
 def format_account_expiration(remaining_hours: Optional[float]) -> tuple:
@@ -119,13 +135,78 @@ class AccountManager:
         self.account_failure_threshold = account_failure_threshold
         self.rate_limit_cooldown_seconds = rate_limit_cooldown_seconds
         self.jwt_manager: Optional['JWTManager'] = None  # 延迟初始化
-        self.is_available = True
+        self.scheduler: Optional[AccountScheduler] = None  # 加入 MultiAccountManager 后设置
+        self._is_available = True
         self.last_error_time = 0.0
         self.last_cooldown_time = 0.0  # 冷却时间戳（401/403/429错误）
         self.quota_cooldowns: Dict[str, float] = {}  # 按配额类型的冷却时间戳 {"text": timestamp, "images": timestamp, "videos": timestamp}
         self.error_count = 0
         self.conversation_count = 0  # 累计对话次数（用于统计展示）
         self.session_usage_count = 0  # 本次启动后使用次数（用于均衡轮询）
+        self.in_flight = 0  # 进行中的请求数
+        self._upload_semaphore: Optional[asyncio.Semaphore] = None  # 附件上传并发上限（按账户）
+        self._upload_limit = 0
+        self.ewma_ttfb_ms: Optional[float] = None  # 首字延迟 EWMA
+        self.ewma_latency_ms: Optional[float] = None  # 完整响应耗时 EWMA
+        self.last_latency_at = 0.0  # 最近一次延迟样本的时间戳
+
+    @property
+    def is_available(self) -> bool:
+        return self._is_available
+
+    @is_available.setter
+    def is_available(self, value: bool) -> None:
+        # 可用状态变化时通知调度器更新就绪集合
+        self._is_available = value
+        if self.scheduler is not None:
+            self.scheduler.refresh(self)
+
+    def upload_semaphore(self, limit: int) -> asyncio.Semaphore:
+        """该账户的附件上传信号量（上限变化后重建，已在上传的请求不受影响）"""
+        if self._upload_semaphore is None or self._upload_limit != limit:
+            self._upload_semaphore = asyncio.Semaphore(limit)
+            self._upload_limit = limit
+        return self._upload_semaphore
+
+    def begin_request(self) -> None:
+        """开始占用账户（进行中请求数 +1）"""
+        self.in_flight += 1
+        if self.scheduler is not None:
+            self.scheduler.load_changed(self)
+
+    def end_request(self) -> None:
+        """结束占用账户（进行中请求数 -1）"""
+        self.in_flight = max(0, self.in_flight - 1)
+        if self.scheduler is not None:
+            self.scheduler.load_changed(self)
+
+    def record_latency(self, ttfb_seconds: Optional[float], total_seconds: float) -> None:
+        """记录一次成功响应的首字延迟和总耗时（EWMA）"""
+        def ewma(current: Optional[float], sample_ms: float) -> float:
+            if current is None:
+                return sample_ms
+            return current + LATENCY_EWMA_ALPHA * (sample_ms - current)
+
+        if ttfb_seconds is not None:
+            self.ewma_ttfb_ms = ewma(self.ewma_ttfb_ms, ttfb_seconds * 1000)
+        self.ewma_latency_ms = ewma(self.ewma_latency_ms, total_seconds * 1000)
+        self.last_latency_at = time.time()
+
+    def latency_estimate(self, now: Optional[float] = None) -> Optional[float]:
+        """用于调度的延迟估计（毫秒）：优先首字延迟，样本过旧时返回 None"""
+        if now is None:
+            now = time.time()
+        if now - self.last_latency_at > LATENCY_SAMPLE_TTL_SECONDS:
+            return None
+        return self.ewma_ttfb_ms if self.ewma_ttfb_ms is not None else self.ewma_latency_ms
+
+    def get_load_info(self) -> Dict[str, Optional[float]]:
+        """账户负载（用于管理面板展示）"""
+        return {
+            "in_flight": self.in_flight,
+            "ewma_ttfb_ms": round(self.ewma_ttfb_ms, 1) if self.ewma_ttfb_ms is not None else None,
+            "ewma_latency_ms": round(self.ewma_latency_ms, 1) if self.ewma_latency_ms is not None else None,
+        }
 
     def handle_non_http_error(self, error_context: str = "", request_id: str = "") -> None:
         """
@@ -227,6 +308,17 @@ class AccountManager:
                 f"{': ' + error_detail[:100] if error_detail else ''}"
             )
 
+    def _ensure_jwt_manager(self):
+        if self.jwt_manager is None:
+            # 延迟初始化 JWTManager (避免循环依赖)
+            from core.jwt import JWTManager
+            self.jwt_manager = JWTManager(self.config, self.http_client, self.user_agent)
+        return self.jwt_manager
+
+    async def get_jwt_untracked(self, request_id: str = "") -> str:
+        """获取 JWT token，不更新账户的可用/错误状态（供后台任务使用，失败只抛出异常）"""
+        return await self._ensure_jwt_manager().get(request_id)
+
     async def get_jwt(self, request_id: str = "") -> str:
         """获取 JWT token (带错误处理)"""
         # 检查账户是否过期
@@ -236,11 +328,7 @@ class AccountManager:
             raise HTTPException(403, f"Account {self.config.account_id} has expired")
 
         try:
-            if self.jwt_manager is None:
-                # 延迟初始化 JWTManager (避免循环依赖)
-                from core.jwt import JWTManager
-                self.jwt_manager = JWTManager(self.config, self.http_client, self.user_agent)
-            jwt = await self.jwt_manager.get(request_id)
+            jwt = await self._ensure_jwt_manager().get(request_id)
             self.is_available = True
             self.error_count = 0
             return jwt
@@ -367,90 +455,38 @@ class MultiAccountManager:
     """多账户协调器"""
     def __init__(self, session_cache_ttl_seconds: int):
         self.accounts: Dict[str, AccountManager] = {}
-        self.account_list: List[str] = []  # 账户ID列表 (用于轮询)
-        self.current_index = 0
-        self._cache_lock = asyncio.Lock()  # 缓存操作专用锁
-        self._counter_lock = threading.Lock()  # 轮询计数器锁
-        self._request_counter = 0  # 请求计数器
-        self._last_account_count = 0  # 可用账户数量
+        self.account_list: List[str] = []  # 账户ID列表
+        # 可用账户调度器（状态变化时增量维护，选择账户不遍历账户池）
+        self.scheduler = AccountScheduler()
         # 全局会话缓存：{conv_key: {"account_id": str, "session_id": str, "updated_at": float}}
-        self.global_session_cache: Dict[str, dict] = {}
-        self.cache_max_size = 1000  # 最大缓存条目数
-        self.cache_ttl = session_cache_ttl_seconds  # 缓存过期时间（秒）
-        # Session级别锁：防止同一对话的并发请求冲突
-        self._session_locks: Dict[str, asyncio.Lock] = {}
-        self._session_locks_lock = asyncio.Lock()  # 保护锁字典的锁
-        self._session_locks_max_size = 2000  # 最大锁数量
-
-    def _clean_expired_cache(self):
-        """清理过期的缓存条目"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, value in self.global_session_cache.items()
-            if current_time - value["updated_at"] > self.cache_ttl
-        ]
-        for key in expired_keys:
-            del self.global_session_cache[key]
-        if expired_keys:
-            logger.info(f"[CACHE] 清理 {len(expired_keys)} 个过期会话缓存")
-
-    def _ensure_cache_size(self):
-        """确保缓存不超过最大大小（LRU策略）"""
-        if len(self.global_session_cache) > self.cache_max_size:
-            # 按更新时间排序，删除最旧的20%
-            sorted_items = sorted(
-                self.global_session_cache.items(),
-                key=lambda x: x[1]["updated_at"]
-            )
-            remove_count = len(sorted_items) - int(self.cache_max_size * 0.8)
-            for key, _ in sorted_items[:remove_count]:
-                del self.global_session_cache[key]
-            logger.info(f"[CACHE] LRU清理 {remove_count} 个最旧会话缓存")
+        self.global_session_cache = SessionCache(session_cache_ttl_seconds)
+        # Session级别锁：防止同一对话的并发请求冲突（引用计数，最后一个持有者释放时删除）
+        self.session_locks = SessionLockTable()
 
     async def start_background_cleanup(self):
         """启动后台缓存清理任务（每5分钟执行一次）"""
         try:
             while True:
                 await asyncio.sleep(300)  # 5分钟
-                async with self._cache_lock:
-                    self._clean_expired_cache()
-                    self._ensure_cache_size()
+                removed = self.global_session_cache.expire()
+                if removed:
+                    logger.info(f"[CACHE] 清理 {removed} 个过期会话缓存")
         except asyncio.CancelledError:
             logger.info("[CACHE] 后台清理任务已停止")
         except Exception as e:
             logger.error(f"[CACHE] 后台清理任务异常: {e}")
 
     async def set_session_cache(self, conv_key: str, account_id: str, session_id: str):
-        """线程安全地设置会话缓存"""
-        async with self._cache_lock:
-            self.global_session_cache[conv_key] = {
-                "account_id": account_id,
-                "session_id": session_id,
-                "updated_at": time.time()
-            }
-            # 检查缓存大小
-            self._ensure_cache_size()
+        """设置会话缓存（超出容量时淘汰最久未使用的条目）"""
+        self.global_session_cache.set(conv_key, account_id, session_id)
 
     async def update_session_time(self, conv_key: str):
-        """线程安全地更新会话时间戳"""
-        async with self._cache_lock:
-            if conv_key in self.global_session_cache:
-                self.global_session_cache[conv_key]["updated_at"] = time.time()
-
-    async def acquire_session_lock(self, conv_key: str) -> asyncio.Lock:
-        """获取指定对话的锁（用于防止同一对话的并发请求冲突）"""
-        async with self._session_locks_lock:
-            # 清理过多的锁（LRU策略：删除不在缓存中的锁）
-            if len(self._session_locks) > self._session_locks_max_size:
-                # 只保留当前缓存中存在的锁
-                valid_keys = set(self.global_session_cache.keys())
-                keys_to_remove = [k for k in self._session_locks if k not in valid_keys]
-                for k in keys_to_remove[:len(keys_to_remove)//2]:  # 删除一半无效锁
-                    del self._session_locks[k]
-
-            if conv_key not in self._session_locks:
-                self._session_locks[conv_key] = asyncio.Lock()
-            return self._session_locks[conv_key]
+        """更新会话时间戳"""
+        self.global_session_cache.touch(conv_key)
+
+    def session_lock(self, conv_key: str):
+        """获取指定对话的锁（async with 使用，防止同一对话的并发请求冲突）"""
+        return self.session_locks.hold(conv_key)
 
     def update_http_client(self, http_client):
         """更新所有账户使用的 http_client（用于代理变更后重建客户端）"""
@@ -467,12 +503,34 @@ class MultiAccountManager:
             manager.conversation_count = global_stats["account_conversations"].get(config.account_id, 0)
         self.accounts[config.account_id] = manager
         self.account_list.append(config.account_id)
+        self.scheduler.add(manager)
         logger.info(f"[MULTI] [ACCOUNT] 添加账户: {config.account_id}")
 
-    async def get_account(self, account_id: Optional[str] = None, request_id: str = "") -> AccountManager:
-        """获取账户 - Round-Robin轮询"""
+    def refresh_account(self, account_id: str) -> None:
+        """账户配置（禁用状态、冷却时长等）被直接修改后，重新评估其可用性"""
+        account = self.accounts.get(account_id)
+        if account is not None:
+            self.scheduler.refresh(account)
+
+    def available_count(self, exclude: Optional[Set[str]] = None) -> int:
+        """可用账户数（exclude 中的账户不计入）"""
+        return self.scheduler.ready_count(exclude)
+
+    def pick_account(self, request_id: str = "", exclude: Optional[Set[str]] = None) -> Optional[AccountManager]:
+        """按调度策略选择可用账户，没有可用账户时返回 None"""
+        selected = self.scheduler.select(exclude)
+        if selected is None:
+            return None
+        selected.session_usage_count += 1
+
         req_tag = f"[req_{request_id}] " if request_id else ""
+        logger.info(f"[MULTI] [ACCOUNT] {req_tag}选择账户: {selected.config.account_id} "
+                    f"(策略: {self.scheduler.policy}, 可用: {self.scheduler.ready_count()}, "
+                    f"使用: {selected.session_usage_count})")
+        return selected
 
+    async def get_account(self, account_id: Optional[str] = None, request_id: str = "") -> AccountManager:
+        """获取账户：指定账户ID时直接返回，否则由调度器选择"""
         # 指定账户ID时直接返回
         if account_id:
             if account_id not in self.accounts:
@@ -482,30 +540,9 @@ class MultiAccountManager:
                 raise HTTPException(503, f"Account {account_id} temporarily unavailable")
             return account
 
-        # 筛选可用账户
-        available_accounts = [
-            acc for acc in self.accounts.values()
-            if (acc.should_retry() and
-                not acc.config.is_expired() and
-                not acc.config.disabled)
-        ]
-
-        if not available_accounts:
+        selected = self.pick_account(request_id)
+        if selected is None:
             raise HTTPException(503, "No available accounts")
-
-        # 轮询选择
-        with self._counter_lock:
-            if len(available_accounts) != self._last_account_count:
-                self._request_counter = random.randint(0, 999999)
-                self._last_account_count = len(available_accounts)
-            index = self._request_counter % len(available_accounts)
-            self._request_counter += 1
-
-        selected = available_accounts[index]
-        selected.session_usage_count += 1
-
-        logger.info(f"[MULTI] [ACCOUNT] {req_tag}选择账户: {selected.config.account_id} "
-                    f"(索引: {index}/{len(available_accounts)}, 使用: {selected.session_usage_count})")
         return selected
 
 
@@ -633,6 +670,7 @@ def load_multi_account_config(
             mail_client_id=acc.get("mail_client_id"),
             mail_refresh_token=acc.get("mail_refresh_token"),
             mail_tenant=acc.get("mail_tenant"),
+            weight=acc.get("weight", 1),
         )
 
         # 检查账户是否已过期（已过期也加载到管理面板）
@@ -678,6 +716,11 @@ def reload_accounts(
         session_cache_ttl_seconds,
         global_stats
     )
+    new_mgr.scheduler.set_policy(multi_account_mgr.scheduler.policy)
+    # 沿用已清空的会话缓存（保留容量设置和统计）与对话锁表（进行中的请求仍持有锁）
+    new_mgr.global_session_cache = multi_account_mgr.global_session_cache
+    new_mgr.global_session_cache.configure(ttl_seconds=session_cache_ttl_seconds)
+    new_mgr.session_locks = multi_account_mgr.session_locks
 
     # 仅恢复统计数据，错误状态全部重置
     for account_id, stats in old_stats.items():
@@ -771,6 +814,7 @@ def update_account_disabled_status(
 
     account_mgr = multi_account_mgr.accounts[account_id]
     account_mgr.config.disabled = disabled
+    multi_account_mgr.refresh_account(account_id)
 
     # 保存到文件
     accounts_data = load_accounts_from_source()
@@ -802,6 +846,7 @@ def bulk_update_account_disabled_status(
             continue
         account_mgr = multi_account_mgr.accounts[account_id]
         account_mgr.config.disabled = disabled
+        multi_account_mgr.refresh_account(account_id)
         success_count += 1
 
     # 2. 只读取一次文件
@@ -18,6 +18,8 @@ from typing import Optional, List
 from pydantic import BaseModel, Field, validator
 from dotenv import load_dotenv
 
+from core.scheduler import SCHEDULING_POLICIES
+
 from core import storage
 
 # 加载 .env 文件
@@ -55,6 +57,13 @@ class BasicConfig(BaseModel):
     refresh_window_hours: int = Field(default=1, ge=0, le=24, description="过期刷新窗口（小时）")
     register_default_count: int = Field(default=1, ge=1, le=30, description="默认注册数量")
     register_domain: str = Field(default="", description="默认注册域名（推荐）")
+    fast_stream_parser: bool = Field(default=True, description="上游流使用字节块批量解析（关闭则回退逐字符解析）")
+    stream_flush_window_ms: int = Field(default=30, ge=0, le=500, description="SSE 增量合并窗口（毫秒，0表示逐条输出）")
+    stream_flush_bytes: int = Field(default=1024, ge=64, le=65536, description="SSE 增量合并字节上限")
+    session_pool_depth: int = Field(default=1, ge=0, le=10, description="每个账户预热的空闲 Session 数（0表示禁用）")
+    session_pool_max_age_seconds: int = Field(default=600, ge=60, le=3600, description="预热 Session 最长存活时间（秒）")
+    upload_concurrency_per_account: int = Field(default=4, ge=1, le=16, description="每个账户同时上传的附件数")
+    url_download_max_mb: int = Field(default=20, ge=1, le=200, description="URL 附件下载大小上限（MB）")
 
 
 class ImageGenerationConfig(BaseModel):
@@ -87,7 +96,15 @@ class RetryConfig(BaseModel):
     account_failure_threshold: int = Field(default=3, ge=1, le=10, description="账户失败阈值")
     rate_limit_cooldown_seconds: int = Field(default=3600, ge=3600, le=43200, description="429冷却时间（秒）")
     session_cache_ttl_seconds: int = Field(default=3600, ge=0, le=86400, description="会话缓存时间（秒，0表示禁用缓存）")
+    session_cache_max_entries: int = Field(default=10000, ge=100, le=1000000, description="会话缓存最大条目数")
     auto_refresh_accounts_seconds: int = Field(default=60, ge=0, le=600, description="自动刷新账号间隔（秒，0禁用）")
+    scheduling_policy: str = Field(default="round_robin", description="账户调度策略：round_robin/least_inflight/p2c_latency/weighted")
+
+    @validator("scheduling_policy")
+    def validate_scheduling_policy(cls, v):
+        if v not in SCHEDULING_POLICIES:
+            raise ValueError(f"scheduling_policy 必须是 {list(SCHEDULING_POLICIES)} 之一")
+        return v
 
 
 class PublicDisplayConfig(BaseModel):
@@ -194,6 +211,13 @@ class ConfigManager:
             refresh_window_hours=int(refresh_window_raw),
             register_default_count=int(register_default_raw),
             register_domain=str(register_domain_raw or "").strip(),
+            fast_stream_parser=_parse_bool(basic_data.get("fast_stream_parser"), True),
+            stream_flush_window_ms=int(basic_data.get("stream_flush_window_ms", 30)),
+            stream_flush_bytes=int(basic_data.get("stream_flush_bytes", 1024)),
+            session_pool_depth=int(basic_data.get("session_pool_depth", 1)),
+            session_pool_max_age_seconds=int(basic_data.get("session_pool_max_age_seconds", 600)),
+            upload_concurrency_per_account=int(basic_data.get("upload_concurrency_per_account", 4)),
+            url_download_max_mb=int(basic_data.get("url_download_max_mb", 20)),
         )
 
         # 4. 加载其他配置（从 YAML）
@@ -212,6 +236,8 @@ class ConfigManager:
             value = retry_data["rate_limit_cooldown_seconds"]
             if value < 3600 or value > 43200:  # 不在 1-12 小时范围，默认 1 小时
                 retry_data["rate_limit_cooldown_seconds"] = 3600
+        if retry_data.get("scheduling_policy") not in (None, *SCHEDULING_POLICIES):
+            retry_data.pop("scheduling_policy")
 
         retry_config = RetryConfig(**retry_data)
 
@@ -309,6 +335,41 @@ class ConfigManager:
         """服务器URL"""
         return self._config.basic.base_url
 
+    @property
+    def fast_stream_parser(self) -> bool:
+        """上游流是否使用字节块批量解析"""
+        return self._config.basic.fast_stream_parser
+
+    @property
+    def stream_flush_window_ms(self) -> int:
+        """SSE 增量合并窗口（毫秒）"""
+        return self._config.basic.stream_flush_window_ms
+
+    @property
+    def stream_flush_bytes(self) -> int:
+        """SSE 增量合并字节上限"""
+        return self._config.basic.stream_flush_bytes
+
+    @property
+    def session_pool_depth(self) -> int:
+        """每个账户预热的空闲 Session 数"""
+        return self._config.basic.session_pool_depth
+
+    @property
+    def session_pool_max_age_seconds(self) -> int:
+        """预热 Session 最长存活时间（秒）"""
+        return self._config.basic.session_pool_max_age_seconds
+
+    @property
+    def upload_concurrency_per_account(self) -> int:
+        """每个账户同时上传的附件数"""
+        return self._config.basic.upload_concurrency_per_account
+
+    @property
+    def url_download_max_mb(self) -> int:
+        """URL 附件下载大小上限（MB）"""
+        return self._config.basic.url_download_max_mb
+
     @property
     def logo_url(self) -> str:
         """Logo URL"""
@@ -374,6 +435,16 @@ class ConfigManager:
         """会话缓存时间（秒）"""
         return self._config.retry.session_cache_ttl_seconds
 
+    @property
+    def session_cache_max_entries(self) -> int:
+        """会话缓存最大条目数"""
+        return self._config.retry.session_cache_max_entries
+
+    @property
+    def scheduling_policy(self) -> str:
+        """账户调度策略"""
+        return self._config.retry.scheduling_policy
+
     @property
     def auto_refresh_accounts_seconds(self) -> int:
         """自动刷新账号间隔（秒，0禁用）"""
@@ -11,7 +11,6 @@ External API 模块 (Fork 定制功能)
 - POST /external/accounts/refresh-token - 刷新账号 token
 - POST /external/accounts/disable      - 禁用账号
 """
-from datetime import datetime, timezone, timedelta
 from typing import Optional
 from fastapi import APIRouter, Header, Body, HTTPException
 
@@ -130,9 +129,6 @@ def create_external_routes(
         """查询即将过期账号（Bearer Token 鉴权，供外部脚本调用）"""
         verify_admin_key(get_admin_key(), authorization)
         
-        beijing_tz = timezone(timedelta(hours=8))
-        now = datetime.now(beijing_tz)
-        
         expired_list = []
         expiring_list = []
         
@@ -148,26 +144,23 @@ def create_external_routes(
             if not expires_at:
                 continue
                 
-            try:
-                expire_time = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
-                expire_time = expire_time.replace(tzinfo=beijing_tz)
-                remaining_hours = (expire_time - now).total_seconds() / 3600
-                
-                if remaining_hours <= 0:
-                    expired_list.append({
-                        "id": account_id,
-                        "expires_at": expires_at,
-                        "status": "expired"
-                    })
-                elif remaining_hours <= hours:
-                    expiring_list.append({
-                        "id": account_id,
-                        "expires_at": expires_at,
-                        "remaining_hours": round(remaining_hours, 2),
-                        "status": "expiring"
-                    })
-            except:
+            remaining_hours = cfg.get_remaining_hours()
+            if remaining_hours is None:
                 continue
+
+            if remaining_hours <= 0:
+                expired_list.append({
+                    "id": account_id,
+                    "expires_at": expires_at,
+                    "status": "expired"
+                })
+            elif remaining_hours <= hours:
+                expiring_list.append({
+                    "id": account_id,
+                    "expires_at": expires_at,
+                    "remaining_hours": round(remaining_hours, 2),
+                    "status": "expiring"
+                })
         
         return {
             "expired": expired_list,
@@ -8,18 +8,25 @@ import logging
 import os
 import time
 import uuid
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, List, Optional
 
 import httpx
+from dotenv import load_dotenv
 from fastapi import HTTPException
 
 if TYPE_CHECKING:
     from main import AccountManager
 
+load_dotenv()
+
 logger = logging.getLogger(__name__)
 
-# Google API 基础URL
-GEMINI_API_BASE = "https://biz-discoveryengine.googleapis.com/v1alpha"
+# Google API 基础URL（可通过环境变量指向本地模拟上游，用于离线压测）
+GEMINI_API_BASE = os.getenv(
+    "GEMINI_API_BASE", "https://biz-discoveryengine.googleapis.com/v1alpha"
+).rstrip("/")
+# JWT 签发（getoxsrf）所在站点
+GEMINI_AUTH_BASE = os.getenv("GEMINI_AUTH_BASE", "https://business.gemini.google").rstrip("/")
 
 
 def get_common_headers(jwt: str, user_agent: str) -> dict:
@@ -101,10 +108,12 @@ async def create_google_session(
     account_manager: "AccountManager",
     http_client: httpx.AsyncClient,
     user_agent: str,
-    request_id: str = ""
+    request_id: str = "",
+    jwt: Optional[str] = None,
 ) -> str:
-    """创建Google Session"""
-    jwt = await account_manager.get_jwt(request_id)
+    """创建Google Session（jwt 为空时通过 get_jwt 获取，并按结果更新账户状态）"""
+    if jwt is None:
+        jwt = await account_manager.get_jwt(request_id)
     headers = get_common_headers(jwt, user_agent)
     body = {
         "configId": account_manager.config.config_id,
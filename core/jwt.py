@@ -8,17 +8,29 @@ import hashlib
 import hmac
 import json
 import logging
+import random
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
 
 import httpx
 from fastapi import HTTPException
 
+from core.google_api import GEMINI_AUTH_BASE
+
 if TYPE_CHECKING:
     from main import AccountConfig
+    from core.account import AccountManager
 
 logger = logging.getLogger(__name__)
 
+# JWT 本地缓存时长（签发的 exp 为 300 秒，留 30 秒余量）
+JWT_LIFETIME_SECONDS = 270
+# 后台预刷新：在有效期的 80%（±5% 抖动，避免同时刷新）时提前换新 token
+PREREFRESH_RATIO = 0.8
+PREREFRESH_JITTER = 0.05
+# 最近多久内使用过的账户才预刷新（冷账户等到下次请求时再按需刷新）
+PREREFRESH_HOT_SECONDS = 600
+
 
 def urlsafe_b64encode(data: bytes) -> str:
     return base64.urlsafe_b64encode(data).decode().rstrip("=")
@@ -63,14 +75,69 @@ class JWTManager:
         self.user_agent = user_agent
         self.jwt: str = ""
         self.expires: float = 0
-        self._lock = asyncio.Lock()
+        self.refresh_at: float = 0  # 后台预刷新时间点
+        self.last_used: float = 0  # 最近一次 get() 的时间
+        self.prefresh_count = 0
+        # 刷新统计
+        self.refresh_count = 0
+        self.refresh_errors = 0
+        self.last_refresh_ms = 0.0
+        self.max_refresh_ms = 0.0
+        self._refresh_total_ms = 0.0
+        # 进行中的刷新（同一时间只有一个，其余调用方等待同一结果）
+        self._refreshing: Optional[asyncio.Task] = None
 
     async def get(self, request_id: str = "") -> str:
-        """获取JWT token（自动刷新）"""
-        async with self._lock:
-            if time.time() > self.expires:
-                await self._refresh(request_id)
+        """获取JWT token（未过期时直接返回缓存，不加锁、不等待）"""
+        now = time.time()
+        self.last_used = now
+        if now <= self.expires:
             return self.jwt
+        await self._refresh_once(request_id)
+        return self.jwt
+
+    async def _refresh_once(self, request_id: str = "") -> None:
+        """single-flight 刷新：已有刷新在进行时等待它完成，而不是再发起一次"""
+        task = self._refreshing
+        if task is None:
+            task = asyncio.create_task(self._timed_refresh(request_id))
+            self._refreshing = task
+            task.add_done_callback(self._on_refresh_done)
+        # shield：单个调用方被取消（客户端断开）时不取消其他调用方共享的刷新
+        await asyncio.shield(task)
+
+    def _on_refresh_done(self, task: asyncio.Task) -> None:
+        if self._refreshing is task:
+            self._refreshing = None
+        if not task.cancelled():
+            # 取出异常，避免所有等待方都已取消时出现 "exception was never retrieved"
+            task.exception()
+
+    async def _timed_refresh(self, request_id: str = "") -> None:
+        start = time.perf_counter()
+        try:
+            await self._refresh(request_id)
+        except Exception:
+            self.refresh_errors += 1
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.refresh_count += 1
+        self.last_refresh_ms = elapsed_ms
+        self.max_refresh_ms = max(self.max_refresh_ms, elapsed_ms)
+        self._refresh_total_ms += elapsed_ms
+
+    def metrics(self) -> dict:
+        return {
+            "refresh_count": self.refresh_count,
+            "refresh_errors": self.refresh_errors,
+            "prefresh_count": self.prefresh_count,
+            "last_refresh_ms": round(self.last_refresh_ms, 1),
+            "avg_refresh_ms": round(self._refresh_total_ms / self.refresh_count, 1)
+            if self.refresh_count
+            else 0.0,
+            "max_refresh_ms": round(self.max_refresh_ms, 1),
+            "expires_in_seconds": max(0, int(self.expires - time.time())),
+        }
 
     async def _refresh(self, request_id: str = "") -> None:
         """刷新JWT token"""
@@ -80,7 +147,7 @@ class JWTManager:
 
         req_tag = f"[req_{request_id}] " if request_id else ""
         r = await self.http_client.get(
-            "https://business.gemini.google/auth/getoxsrf",
+            f"{GEMINI_AUTH_BASE}/auth/getoxsrf",
             params={"csesidx": self.config.csesidx},
             headers={
                 "cookie": cookie,
@@ -96,6 +163,61 @@ class JWTManager:
         data = json.loads(txt)
 
         key_bytes = base64.urlsafe_b64decode(data["xsrfToken"] + "==")
+        now = time.time()
         self.jwt      = create_jwt(key_bytes, data["keyId"], self.config.csesidx)
-        self.expires = time.time() + 270
+        self.expires = now + JWT_LIFETIME_SECONDS
+        jitter = random.uniform(-PREREFRESH_JITTER, PREREFRESH_JITTER)
+        self.refresh_at = now + JWT_LIFETIME_SECONDS * (PREREFRESH_RATIO + jitter)
         logger.info(f"[AUTH] [{self.config.account_id}] {req_tag}JWT 刷新成功")
+
+    def due_for_prefresh(self, now: float) -> bool:
+        """token 仍有效、已到预刷新时间点，且账户最近被使用过"""
+        return (
+            self._refreshing is None
+            and bool(self.jwt)
+            and self.refresh_at <= now < self.expires
+            and now - self.last_used <= PREREFRESH_HOT_SECONDS
+        )
+
+    async def prefresh(self) -> None:
+        """后台预刷新：新 token 到手后一次性替换，期间的请求继续使用旧 token"""
+        if self._refreshing is not None:
+            return
+        try:
+            await self._refresh_once()
+            self.prefresh_count += 1
+        except Exception as e:
+            # 失败不影响当前 token，过期后由请求路径按需刷新并走正常的错误处理
+            logger.warning(
+                f"[AUTH] [{self.config.account_id}] JWT 预刷新失败: {type(e).__name__}: {str(e)[:100]}"
+            )
+
+
+async def run_prefresh_loop(
+    get_accounts: Callable[[], Iterable["AccountManager"]],
+    interval: float = 5.0,
+    max_concurrency: int = 8,
+) -> None:
+    """定期为热账户预刷新即将到期的 JWT，使请求路径上不再出现 getoxsrf 往返"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def refresh_one(manager: JWTManager) -> None:
+        async with semaphore:
+            await manager.prefresh()
+
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            due = [
+                account.jwt_manager
+                for account in list(get_accounts())
+                if account.jwt_manager is not None
+                and account.is_available
+                and not account.config.disabled
+                and account.jwt_manager.due_for_prefresh(now)
+            ]
+            if due:
+                await asyncio.gather(*(refresh_one(manager) for manager in due))
+    except asyncio.CancelledError:
+        logger.info("[AUTH] JWT 预刷新任务已停止")
@@ -3,19 +3,23 @@
 负责消息的解析、文本提取和会话指纹生成
 """
 import asyncio
-import base64
 import hashlib
 import logging
 import re
-from typing import List, TYPE_CHECKING
+from typing import List, Optional, TYPE_CHECKING, Union
 
 import httpx
 
+from core.url_cache import Base64Buffer, UrlDownloadCache
+
 if TYPE_CHECKING:
     from main import Message
 
 logger = logging.getLogger(__name__)
 
+# URL 文件下载大小上限（默认值，实际由配置传入）
+DEFAULT_MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
 
 def _is_internal_notice(text: str) -> bool:
     """判断是否为服务端注入的诊断提示。
@@ -26,51 +30,47 @@ def _is_internal_notice(text: str) -> bool:
     return t.startswith("⚠️ 上游返回为空") or ("上游未返回文本/图片" in t)
 
 
-def get_conversation_key(messages: List[dict], client_identifier: str = "") -> str:
-    """
-    生成对话指纹（使用前3条消息+客户端标识，确保唯一性）
+def _message_field(msg, name: str):
+    """兼容 Message 对象和字典两种消息格式"""
+    if isinstance(msg, dict):
+        return msg.get(name, "")
+    return getattr(msg, name, "")
 
-    策略：
-    1. 使用前3条消息生成指纹（而非仅第1条）
-    2. 加入客户端标识（IP或request_id）避免不同用户冲突
-    3. 保持Session复用能力（同一用户的后续消息仍能找到同一Session）
 
-    Args:
-        messages: 消息列表
-        client_identifier: 客户端标识（如IP地址或request_id），用于区分不同用户
-    """
-    if not messages:
-        return f"{client_identifier}:empty" if client_identifier else "empty"
-
-    # 提取前3条消息的关键信息（角色+内容）
-    message_fingerprints = []
-    for msg in messages[:3]:  # 只取前3条
-        role = msg.get("role", "")
-        content = msg.get("content", "")
+def extend_history_key(prev_key: str, role: str, text: str) -> str:
+    """在历史指纹后追加一条消息：key_i = blake2b(key_{i-1} | role | 文本)"""
+    hasher = hashlib.blake2b(bytes.fromhex(prev_key), digest_size=16)
+    hasher.update(f"\x1f{role}:".encode())
+    hasher.update(text.strip().encode())
+    return hasher.hexdigest()
 
-        # 统一处理内容格式（字符串或数组）
-        if isinstance(content, list):
-            # 多模态消息：只提取文本部分
-            text = extract_text_from_content(content)
-        else:
-            text = str(content)
 
-        # 过滤服务端诊断提示，避免污染会话指纹
-        if role == "assistant" and _is_internal_notice(text):
-            continue
+def get_history_keys(messages: List[Union['Message', dict]], client_identifier: str = "") -> List[str]:
+    """
+    生成对话历史的前缀指纹链：返回值第 i 项对应 messages[:i+1]
 
-        # 标准化：去除首尾空白，转小写
-        text = text.strip().lower()
+    - 以客户端标识（IP）为种子，避免不同用户冲突
+    - 逐条增量哈希，只读取文本部分（不复制、不读取图片等文件数据）
+    - 服务端诊断提示不进入指纹（该条消息的指纹与上一条相同）
 
-        # 组合角色和内容
-        message_fingerprints.append(f"{role}:{text}")
+    Args:
+        messages: 消息列表（Message 对象或字典）
+        client_identifier: 客户端标识（如IP地址），用于区分不同用户
+    """
+    key = hashlib.blake2b(client_identifier.encode(), digest_size=16).hexdigest()
+    keys = []
+    for msg in messages:
+        role = _message_field(msg, "role") or ""
+        content = _message_field(msg, "content")
 
-    # 使用前3条消息+客户端标识生成指纹
-    conversation_prefix = "|".join(message_fingerprints)
-    if client_identifier:
-        conversation_prefix = f"{client_identifier}|{conversation_prefix}"
+        # 多模态消息只提取文本部分
+        text = extract_text_from_content(content) if content is not None else ""
 
-    return hashlib.md5(conversation_prefix.encode()).hexdigest()
+        # 过滤服务端诊断提示，避免污染会话指纹
+        if not (role == "assistant" and _is_internal_notice(text)):
+            key = extend_history_key(key, role, text)
+        keys.append(key)
+    return keys
 
 
 def extract_text_from_content(content) -> str:
@@ -87,7 +87,78 @@ def extract_text_from_content(content) -> str:
         return str(content)
 
 
-async def parse_last_message(messages: List['Message'], http_client: httpx.AsyncClient, request_id: str = ""):
+async def download_url_as_base64(
+    url: str,
+    http_client: httpx.AsyncClient,
+    max_bytes: int = DEFAULT_MAX_DOWNLOAD_BYTES,
+    cache: Optional[UrlDownloadCache] = None,
+    request_id: str = "",
+) -> Optional[dict]:
+    """流式下载 URL 文件并边下载边编码为 base64，超过 max_bytes 时放弃（返回 None）
+
+    有缓存时：TTL 内直接复用；过期后带 ETag/Last-Modified 条件请求，304 时继续复用
+    """
+    cached = cache.lookup(url) if cache is not None else None
+    if cached is not None and cache.is_fresh(cached):
+        cache.hit(cached)
+        logger.info(f"[FILE] [req_{request_id}] URL文件命中缓存: {url[:50]}... ({cached['size']} bytes)")
+        return {"mime": cached["mime"], "data": cached["data"]}
+
+    headers = cache.validators(cached) if cache is not None else {}
+    async with http_client.stream("GET", url, headers=headers, timeout=30, follow_redirects=True) as resp:
+        if resp.status_code == 304 and cached is not None:
+            cache.hit(cached, revalidated=True)
+            logger.info(f"[FILE] [req_{request_id}] URL文件未变化(304)，复用缓存: {url[:50]}...")
+            return {"mime": cached["mime"], "data": cached["data"]}
+        if resp.status_code == 404:
+            if cache is not None:
+                cache.discard(url)
+            logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
+            return None
+        resp.raise_for_status()
+
+        try:
+            content_length = int(resp.headers.get("content-length", ""))
+        except ValueError:
+            content_length = None
+        if content_length is not None and content_length > max_bytes:
+            logger.warning(
+                f"[FILE] [req_{request_id}] URL文件过大({content_length} bytes，上限 {max_bytes})，已跳过: {url[:50]}..."
+            )
+            return None
+
+        encoder = Base64Buffer(content_length)
+        async for chunk in resp.aiter_bytes():
+            encoder.feed(chunk)
+            if encoder.size > max_bytes:
+                logger.warning(
+                    f"[FILE] [req_{request_id}] URL文件超过大小上限({max_bytes} bytes)，已跳过: {url[:50]}..."
+                )
+                return None
+
+        # 移除图片类型限制，支持所有文件类型
+        content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
+        data = encoder.getvalue()
+        if cache is not None:
+            cache.store(
+                url,
+                content_type,
+                data,
+                encoder.size,
+                etag=resp.headers.get("etag"),
+                last_modified=resp.headers.get("last-modified"),
+            )
+    logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({encoder.size} bytes, {content_type})")
+    return {"mime": content_type, "data": data}
+
+
+async def parse_last_message(
+    messages: List['Message'],
+    http_client: httpx.AsyncClient,
+    request_id: str = "",
+    max_download_bytes: int = DEFAULT_MAX_DOWNLOAD_BYTES,
+    download_cache: Optional[UrlDownloadCache] = None,
+):
     """解析最后一条消息，分离文本和文件（支持图片、PDF、文档等，base64 和 URL）"""
     if not messages:
         return "", []
@@ -120,16 +191,9 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
     if image_urls:
         async def download_url(url: str):
             try:
-                resp = await http_client.get(url, timeout=30, follow_redirects=True)
-                if resp.status_code == 404:
-                    logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
-                    return None
-                resp.raise_for_status()
-                content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
-                # 移除图片类型限制，支持所有文件类型
-                b64 = base64.b64encode(resp.content).decode()
-                logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({len(resp.content)} bytes, {content_type})")
-                return {"mime": content_type, "data": b64}
+                return await download_url_as_base64(
+                    url, http_client, max_download_bytes, download_cache, request_id
+                )
             except httpx.HTTPStatusError as e:
                 status_code = e.response.status_code if e.response else "unknown"
                 logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败({status_code}): {url[:50]}... - {e}")
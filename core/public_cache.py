@@ -0,0 +1,124 @@
+"""
+公开端点（/public/log、/public/stats）的响应缓存与访客计数。
+
+- PublicResponseCache：按 key 缓存序列化后的响应体，TTL 内直接复用，并生成 ETag，
+  客户端带 If-None-Match 命中时返回 304
+- VisitorTracker：24 小时内按 IP 去重的访客记录，按首次访问时间排序，过期项从头部淘汰，
+  每次访问 O(1)，由统计数据的后台写回任务持久化
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+VISITOR_WINDOW_SECONDS = 86400
+# 访客表最多保留的 IP 数，超出时淘汰最早的记录（只影响去重，不影响已计数的总访客数）
+MAX_VISITOR_ENTRIES = 100000
+
+
+class VisitorTracker:
+    """24 小时内按 IP 去重的访客表"""
+
+    __slots__ = ("_seen", "_window", "_max_entries")
+
+    def __init__(self, window: int = VISITOR_WINDOW_SECONDS, max_entries: int = MAX_VISITOR_ENTRIES) -> None:
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._window = window
+        self._max_entries = max_entries
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self._window
+        while self._seen:
+            ip, first_seen = next(iter(self._seen.items()))
+            if first_seen >= cutoff and len(self._seen) <= self._max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def visit(self, ip: str, now: Optional[float] = None) -> bool:
+        """记录一次访问，窗口内首次出现的 IP 返回 True"""
+        if now is None:
+            now = time.time()
+        self._expire(now)
+        if ip in self._seen:
+            return False
+        self._seen[ip] = now
+        if len(self._seen) > self._max_entries:
+            self._seen.popitem(last=False)
+        return True
+
+    def to_dict(self) -> Dict[str, float]:
+        return dict(self._seen)
+
+    @classmethod
+    def from_dict(cls, data: object) -> "VisitorTracker":
+        tracker = cls()
+        if isinstance(data, dict):
+            items = [
+                (str(ip), float(ts))
+                for ip, ts in data.items()
+                if isinstance(ts, (int, float))
+            ]
+            for ip, ts in sorted(items, key=lambda item: item[1]):
+                tracker._seen[ip] = ts
+            tracker._expire(time.time())
+        return tracker
+
+
+class PublicResponseCache:
+    """短 TTL 的 JSON 响应缓存（带 ETag / 304）"""
+
+    def __init__(self, ttl: float = 2.0, max_entries: int = 64) -> None:
+        self._ttl = ttl
+        self._max_entries = max_entries
+        # key -> (过期时间, 响应体, ETag)
+        self._entries: "OrderedDict[str, Tuple[float, bytes, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _get(self, key: str, build: Callable[[], dict]) -> Tuple[bytes, str]:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+        self.misses += 1
+        body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self._entries[key] = (now + self._ttl, body, etag)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return body, etag
+
+    def respond(self, request: Request, key: str, build: Callable[[], dict]) -> Response:
+        """返回缓存的响应；If-None-Match 与当前 ETag 一致时返回 304"""
+        body, etag = self._get(key, build)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "ttl_seconds": self._ttl,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
@@ -0,0 +1,134 @@
+"""
+请求生命周期事件：按 request_id 记录结构化时间线，供 /public/log 与 /admin/log 直接读取。
+
+聊天路径在关键节点（开始、选择账户、重试、切换账户、完成）写入事件，
+不再从日志文本中用正则反推请求过程。
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+# 最多保留的请求数（与内存日志缓冲区容量一致）和单个请求的事件数
+MAX_REQUESTS = 1000
+MAX_EVENTS_PER_REQUEST = 20
+
+
+def _format_time(ts: Optional[float] = None) -> str:
+    return datetime.fromtimestamp(ts or time.time(), tz=BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class _Timeline:
+    __slots__ = ("request_id", "start_time", "status", "events", "select_count", "retry_count")
+
+    def __init__(self, request_id: str, start_time: str) -> None:
+        self.request_id = request_id
+        self.start_time = start_time
+        self.status = "in_progress"
+        self.events: List[dict] = []
+        self.select_count = 0
+        self.retry_count = 0
+
+    def add(self, event: dict) -> None:
+        if len(self.events) < MAX_EVENTS_PER_REQUEST:
+            self.events.append(event)
+        else:
+            # 超出上限时保留开始事件，替换最后一条
+            self.events[-1] = event
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "start_time": self.start_time,
+            "status": self.status,
+            "events": list(self.events),
+        }
+
+
+class RequestEventLog:
+    """按 request_id 索引的请求时间线环形缓冲（超出容量时淘汰最早的请求）"""
+
+    def __init__(self, max_requests: int = MAX_REQUESTS) -> None:
+        self._max_requests = max_requests
+        self._timelines: "OrderedDict[str, _Timeline]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._timelines)
+
+    def start(self, request_id: str, model: Optional[str], message_count: Optional[int] = None) -> None:
+        """开始对话"""
+        now = _format_time()
+        timeline = _Timeline(request_id, now)
+        if model:
+            content = f"{model} | {message_count}条消息" if message_count else model
+        else:
+            content = "请求处理中"
+        timeline.add({"time": now, "type": "start", "content": content})
+        self._timelines[request_id] = timeline
+        self._timelines.move_to_end(request_id)
+        while len(self._timelines) > self._max_requests:
+            self._timelines.popitem(last=False)
+
+    def select_account(self, request_id: str) -> None:
+        """通过调度选中账户：第一次为选择服务节点，之后为切换服务节点"""
+        timeline = self._timelines.get(request_id)
+        if timeline is None:
+            return
+        timeline.select_count += 1
+        if timeline.select_count == 1:
+            timeline.add({"time": _format_time(), "type": "select", "content": "选择服务节点"})
+        else:
+            timeline.add({"time": _format_time(), "type": "switch", "content": "切换服务节点"})
+
+    def switch_account(self, request_id: str) -> None:
+        """请求失败后切换到其他账户"""
+        timeline = self._timelines.get(request_id)
+        if timeline is None:
+            return
+        timeline.select_count += 1
+        timeline.add({"time": _format_time(), "type": "switch", "content": "切换服务节点"})
+
+    def retry(self, request_id: str) -> None:
+        """上游异常后重试"""
+        timeline = self._timelines.get(request_id)
+        if timeline is None:
+            return
+        timeline.retry_count += 1
+        timeline.add(
+            {
+                "time": _format_time(),
+                "type": "retry",
+                "content": f"服务异常，正在重试（{timeline.retry_count}）",
+            }
+        )
+
+    def complete(self, request_id: str, status: str, duration_s: Optional[float] = None) -> None:
+        """请求结束：status 为 success / error / timeout"""
+        timeline = self._timelines.get(request_id)
+        if timeline is None or timeline.status != "in_progress":
+            return
+        timeline.status = status
+        if status == "success":
+            content = f"响应完成 | 耗时{duration_s:.2f}s" if duration_s is not None else "响应完成"
+        elif status == "timeout":
+            content = "请求超时"
+        else:
+            content = "请求失败"
+        timeline.add({"time": _format_time(), "type": "complete", "status": status, "content": content})
+
+    def recent(self, limit: int = 100) -> List[Dict]:
+        """最近的 limit 个请求时间线（新 -> 旧）"""
+        result = []
+        for request_id in reversed(self._timelines):
+            if len(result) >= limit:
+                break
+            result.append(self._timelines[request_id].to_dict())
+        return result
+
+    def clear(self) -> int:
+        count = len(self._timelines)
+        self._timelines.clear()
+        return count
@@ -0,0 +1,359 @@
+"""
+账户调度器：维护可用账户的索引集合，选择账户时不再遍历整个账户池。
+
+- 就绪集合：账户状态变化（冷却开始/结束、错误禁用、手动禁用、过期）时增量更新
+- 定时器堆：记录冷却结束、账户过期的时间点，选择账户时弹出到期项重新评估
+- 选择策略：round_robin（轮询）、least_inflight（进行中请求最少）、
+  p2c_latency（随机取两个账户，选 首字延迟 EWMA × 进行中请求数 较小者）、weighted（按权重随机）
+"""
+
+import heapq
+import random
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from core.account import AccountManager
+
+SCHEDULING_POLICIES = ("round_robin", "least_inflight", "p2c_latency", "weighted")
+
+# 冷却结束定时器的余量：should_retry() 判断的是"超过"冷却时间
+_COOLDOWN_EPSILON = 0.01
+
+
+class _FenwickTree:
+    """按槽位存放整数权重的树状数组：更新与按权重定位都是 O(log n)"""
+
+    __slots__ = ("size", "tree")
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, target: int) -> int:
+        """返回前缀和第一次超过 target 的槽位（0 <= target < 总权重）"""
+        pos = 0
+        step = 1 << (self.size.bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+
+class AccountScheduler:
+    """可用账户集合 + 选择策略
+
+    账户状态由 AccountManager 在变化时通过 refresh() 通知；选择时再做一次 O(1) 校验，
+    漏掉的状态变化会在被选中时修正。
+    """
+
+    def __init__(self, policy: str = "round_robin") -> None:
+        self.policy = policy if policy in SCHEDULING_POLICIES else "round_robin"
+        self._accounts: Dict[str, "AccountManager"] = {}
+        # 就绪集合：列表用于按下标轮询/按权重定位，字典记录下标（删除时与末尾交换）
+        self._ready: List[str] = []
+        self._slots: Dict[str, int] = {}
+        self._cursor = random.randint(0, 999999)
+        # weighted：槽位权重树
+        self._weights = _FenwickTree(16)
+        self._slot_weights: List[int] = []
+        self._total_weight = 0
+        # least_inflight：按进行中请求数分桶（桶内保持插入顺序，用于同负载轮转）
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        self._loads: Dict[str, int] = {}
+        self._min_load = 0
+        # 定时器堆：(时间点, account_id)，每个账户只有 _timer_at 中记录的那一项有效
+        self._timers: List[Tuple[float, str]] = []
+        self._timer_at: Dict[str, float] = {}
+
+    # ---------- 账户注册与状态 ----------
+
+    def add(self, account: "AccountManager") -> None:
+        account_id = account.config.account_id
+        self._accounts[account_id] = account
+        account.scheduler = self
+        self.refresh(account)
+
+    def remove(self, account_id: str) -> None:
+        self._discard(account_id)
+        self._accounts.pop(account_id, None)
+        self._timer_at.pop(account_id, None)
+
+    def set_policy(self, policy: str) -> None:
+        if policy in SCHEDULING_POLICIES:
+            self.policy = policy
+
+    def _is_ready(self, account: "AccountManager", now: float) -> bool:
+        expires_at = account.config.expires_ts
+        return (
+            account.is_available
+            and not account.config.disabled
+            and (expires_at is None or expires_at > now)
+        )
+
+    def refresh(self, account: "AccountManager", now: Optional[float] = None) -> None:
+        """根据账户当前状态更新就绪集合和定时器"""
+        account_id = account.config.account_id
+        if self._accounts.get(account_id) is not account:
+            return
+        if now is None:
+            now = time.time()
+        expires_at = account.config.expires_ts
+
+        if self._is_ready(account, now):
+            self._insert(account_id)
+            if expires_at is not None:
+                self._schedule(account_id, expires_at)
+            return
+
+        self._discard(account_id)
+        if account.config.disabled or (expires_at is not None and expires_at <= now):
+            return
+        # 限流/认证错误冷却：到期后自动恢复；普通错误禁用没有定时器
+        if account.last_cooldown_time > 0:
+            self._schedule(
+                account_id,
+                account.last_cooldown_time + account.rate_limit_cooldown_seconds + _COOLDOWN_EPSILON,
+            )
+
+    def refresh_all(self) -> None:
+        now = time.time()
+        for account in self._accounts.values():
+            self.refresh(account, now)
+
+    def load_changed(self, account: "AccountManager") -> None:
+        """进行中请求数变化后调整所在的负载桶"""
+        account_id = account.config.account_id
+        old = self._loads.get(account_id)
+        if old is None or old == account.in_flight or self._accounts.get(account_id) is not account:
+            return
+        self._bucket_remove(account_id)
+        self._bucket_add(account_id, account.in_flight)
+
+    # ---------- 定时器 ----------
+
+    def _schedule(self, account_id: str, ts: float) -> None:
+        if self._timer_at.get(account_id) == ts:
+            return
+        self._timer_at[account_id] = ts
+        heapq.heappush(self._timers, (ts, account_id))
+        # 过期的堆项过多时重建
+        if len(self._timers) > 4 * len(self._accounts) + 64:
+            self._timers = [(t, a) for a, t in self._timer_at.items()]
+            heapq.heapify(self._timers)
+
+    def _run_timers(self, now: float) -> None:
+        while self._timers and self._timers[0][0] <= now:
+            ts, account_id = heapq.heappop(self._timers)
+            if self._timer_at.get(account_id) != ts:
+                continue
+            del self._timer_at[account_id]
+            account = self._accounts.get(account_id)
+            if account is None:
+                continue
+            # 冷却期已过时 should_retry() 会恢复可用状态（并触发 refresh）
+            account.should_retry()
+            self.refresh(account, now)
+
+    # ---------- 就绪集合 ----------
+
+    def _weight_of(self, account_id: str) -> int:
+        try:
+            return max(1, int(getattr(self._accounts[account_id].config, "weight", 1) or 1))
+        except (TypeError, ValueError):
+            return 1
+
+    def _insert(self, account_id: str) -> None:
+        if account_id in self._slots:
+            return
+        slot = len(self._ready)
+        self._ready.append(account_id)
+        self._slots[account_id] = slot
+
+        weight = self._weight_of(account_id)
+        self._slot_weights.append(weight)
+        self._total_weight += weight
+        if len(self._ready) > self._weights.size:
+            self._rebuild_weights()
+        else:
+            self._weights.add(slot, weight)
+
+        self._bucket_add(account_id, self._accounts[account_id].in_flight)
+
+    def _discard(self, account_id: str) -> None:
+        slot = self._slots.pop(account_id, None)
+        if slot is None:
+            return
+        last_slot = len(self._ready) - 1
+        last_id = self._ready.pop()
+        last_weight = self._slot_weights.pop()
+        weight = last_weight if last_id == account_id else self._slot_weights[slot]
+        self._weights.add(last_slot, -last_weight)
+        self._total_weight -= weight
+        if last_id != account_id:
+            # 末尾账户移到被删除的槽位
+            self._weights.add(slot, last_weight - weight)
+            self._ready[slot] = last_id
+            self._slot_weights[slot] = last_weight
+            self._slots[last_id] = slot
+
+        self._bucket_remove(account_id)
+
+    def _rebuild_weights(self) -> None:
+        size = self._weights.size
+        while size < len(self._ready):
+            size *= 2
+        self._weights = _FenwickTree(size)
+        for slot, weight in enumerate(self._slot_weights):
+            self._weights.add(slot, weight)
+
+    def _bucket_add(self, account_id: str, load: int) -> None:
+        self._loads[account_id] = load
+        self._buckets.setdefault(load, {})[account_id] = None
+        if load < self._min_load:
+            self._min_load = load
+
+    def _bucket_remove(self, account_id: str) -> None:
+        load = self._loads.pop(account_id, None)
+        if load is None:
+            return
+        bucket = self._buckets.get(load)
+        if bucket is not None:
+            bucket.pop(account_id, None)
+            if not bucket:
+                del self._buckets[load]
+        if not self._buckets:
+            self._min_load = 0
+
+    # ---------- 选择 ----------
+
+    def _pick_round_robin(self, exclude: Optional[Iterable[str]]) -> Optional[str]:
+        count = len(self._ready)
+        for _ in range(count):
+            account_id = self._ready[self._cursor % count]
+            self._cursor += 1
+            if not exclude or account_id not in exclude:
+                return account_id
+        return None
+
+    def _pick_least_inflight(self, exclude: Optional[Iterable[str]]) -> Optional[str]:
+        if not self._buckets:
+            return None
+        # _min_load 不大于真实最小负载，向上找到第一个非空桶
+        while self._min_load not in self._buckets:
+            self._min_load += 1
+        loads = [self._min_load] if not exclude else sorted(self._buckets)
+        for load in loads:
+            bucket = self._buckets[load]
+            for account_id in bucket:
+                if exclude and account_id in exclude:
+                    continue
+                # 同负载的账户轮转
+                del bucket[account_id]
+                bucket[account_id] = None
+                return account_id
+        return None
+
+    def _better(self, first_id: str, second_id: str, now: float) -> str:
+        """p2c 比较：都有延迟样本时比较 延迟 × (进行中请求数 + 1)，否则先比进行中请求数，再优先没有样本的账户"""
+        first, second = self._accounts[first_id], self._accounts[second_id]
+        first_latency = first.latency_estimate(now)
+        second_latency = second.latency_estimate(now)
+        if first_latency is None or second_latency is None:
+            first_key = (first.in_flight, first_latency is not None)
+            second_key = (second.in_flight, second_latency is not None)
+            return first_id if first_key <= second_key else second_id
+        first_cost = first_latency * (first.in_flight + 1)
+        second_cost = second_latency * (second.in_flight + 1)
+        return first_id if first_cost <= second_cost else second_id
+
+    def _pick_p2c_latency(self, exclude: Optional[Iterable[str]]) -> Optional[str]:
+        count = len(self._ready)
+        if not count:
+            return None
+        now = time.time()
+        pool: List[str] = self._ready
+        for attempt in range(9):
+            if attempt == 8:
+                # 大部分账户都被排除时改为在剩余账户中抽取
+                pool = [account_id for account_id in self._ready if account_id not in exclude]
+                if not pool:
+                    return None
+            size = len(pool)
+            first_index = random.randrange(size)
+            second_index = random.randrange(size - 1) if size > 1 else 0
+            if size > 1 and second_index >= first_index:
+                second_index += 1
+            first, second = pool[first_index], pool[second_index]
+            if exclude:
+                if first in exclude:
+                    first = second
+                elif second in exclude:
+                    second = first
+                if first in exclude:
+                    continue
+            return self._better(first, second, now)
+        return None
+
+    def _pick_weighted(self, exclude: Optional[Iterable[str]]) -> Optional[str]:
+        if self._total_weight <= 0:
+            return self._pick_round_robin(exclude)
+        for _ in range(8):
+            account_id = self._ready[self._weights.find(random.randrange(self._total_weight))]
+            if not exclude or account_id not in exclude:
+                return account_id
+        # 大部分权重都被排除时退化为线性筛选
+        candidates = [
+            (account_id, self._slot_weights[slot])
+            for account_id, slot in self._slots.items()
+            if account_id not in exclude
+        ]
+        if not candidates:
+            return None
+        ids, weights = zip(*candidates)
+        return random.choices(ids, weights=weights)[0]
+
+    def select(self, exclude: Optional[Iterable[str]] = None) -> Optional["AccountManager"]:
+        """按当前策略选择一个就绪账户，exclude 中的账户不参与选择"""
+        now = time.time()
+        self._run_timers(now)
+        pick = {
+            "least_inflight": self._pick_least_inflight,
+            "p2c_latency": self._pick_p2c_latency,
+            "weighted": self._pick_weighted,
+        }.get(self.policy, self._pick_round_robin)
+
+        while self._ready:
+            account_id = pick(exclude)
+            if account_id is None:
+                return None
+            account = self._accounts[account_id]
+            if self._is_ready(account, now):
+                return account
+            # 状态已变化但没有通知到，移出就绪集合后重新选择
+            self.refresh(account, now)
+        return None
+
+    def ready_count(self, exclude: Optional[Iterable[str]] = None) -> int:
+        self._run_timers(time.time())
+        count = len(self._ready)
+        if exclude:
+            count -= sum(1 for account_id in exclude if account_id in self._slots)
+        return count
+
+    def metrics(self) -> dict:
+        return {
+            "policy": self.policy,
+            "ready_accounts": len(self._ready),
+            "total_accounts": len(self._accounts),
+            "pending_timers": len(self._timer_at),
+        }
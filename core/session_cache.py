@@ -0,0 +1,204 @@
+"""
+会话缓存与对话锁表。
+
+- SessionCache：对话历史指纹 -> 绑定账户/Session 的 LRU 缓存。所有条目 TTL 相同且访问时移到末尾，
+  OrderedDict 的顺序同时就是过期顺序，插入、访问、淘汰、过期清理都只动头部或单个节点（O(1)）。
+  每个 Session 以其已发送历史的指纹为 key，请求按"最长的已记录历史前缀"找到 Session，
+  每轮结束后把 key 更新为包含本轮消息的新指纹
+- SessionLockTable：按 conv_key 引用计数的锁表，最后一个持有者释放时删除条目，
+  热路径上没有全局锁（单事件循环内字典操作之间没有 await）
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class SessionCache:
+    """会话缓存：{conv_key: {"account_id": str, "session_id": str, "updated_at": float}}"""
+
+    def __init__(self, ttl_seconds: int, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rekeys = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, conv_key: str) -> bool:
+        return self.peek(conv_key) is not None
+
+    def configure(self, ttl_seconds: Optional[int] = None, max_entries: Optional[int] = None) -> None:
+        if ttl_seconds is not None:
+            self.ttl_seconds = ttl_seconds
+        if max_entries is not None:
+            self.max_entries = max_entries
+        self.expire()
+        self._evict()
+
+    def _is_expired(self, entry: dict, now: float) -> bool:
+        return now - entry["updated_at"] > self.ttl_seconds
+
+    def peek(self, conv_key: str) -> Optional[dict]:
+        """读取未过期的条目，不计入命中统计、不调整 LRU 顺序"""
+        entry = self._entries.get(conv_key)
+        if entry is None:
+            return None
+        if self._is_expired(entry, time.time()):
+            del self._entries[conv_key]
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, conv_key: str) -> Optional[dict]:
+        """查找对话绑定的 Session（过期条目视为未命中并删除）"""
+        entry = self.peek(conv_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def find_longest_prefix(self, prefix_keys: List[str]) -> Optional[int]:
+        """按从长到短的顺序查找已记录的历史前缀，返回命中项在 prefix_keys 中的下标"""
+        for index in range(len(prefix_keys) - 1, -1, -1):
+            if self.peek(prefix_keys[index]) is not None:
+                self.hits += 1
+                return index
+        self.misses += 1
+        return None
+
+    def rekey(self, old_key: str, new_key: str) -> bool:
+        """把条目移到新的历史指纹下（刷新访问时间），旧 key 不存在时返回 False"""
+        entry = self._entries.pop(old_key, None)
+        if entry is None:
+            return False
+        entry["updated_at"] = time.time()
+        self._entries[new_key] = entry
+        self._entries.move_to_end(new_key)
+        if old_key != new_key:
+            self.rekeys += 1
+        return True
+
+    def set(self, conv_key: str, account_id: str, session_id: str) -> None:
+        self._entries[conv_key] = {
+            "account_id": account_id,
+            "session_id": session_id,
+            "updated_at": time.time(),
+        }
+        self._entries.move_to_end(conv_key)
+        self._evict()
+
+    def touch(self, conv_key: str) -> None:
+        """刷新访问时间并移到 LRU 末尾"""
+        entry = self._entries.get(conv_key)
+        if entry is not None:
+            entry["updated_at"] = time.time()
+            self._entries.move_to_end(conv_key)
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def expire(self) -> int:
+        """从头部清理过期条目，返回清理数量"""
+        now = time.time()
+        removed = 0
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if not self._is_expired(entry, now):
+                break
+            self._entries.popitem(last=False)
+            removed += 1
+        self.expirations += removed
+        return removed
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rekeys": self.rekeys,
+        }
+
+
+class _LockEntry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class SessionLockTable:
+    """按 conv_key 引用计数的对话锁（防止同一对话的并发请求冲突）"""
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, _LockEntry] = {}
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _release_ref(self, conv_key: str, entry: _LockEntry) -> None:
+        entry.refs -= 1
+        if entry.refs == 0 and self._entries.get(conv_key) is entry:
+            del self._entries[conv_key]
+
+    @asynccontextmanager
+    async def hold(self, conv_key: str) -> AsyncIterator[None]:
+        """持有对话锁；等待者和持有者都计入引用，最后一个离开时删除条目"""
+        entry = self._entries.get(conv_key)
+        if entry is None:
+            entry = self._entries[conv_key] = _LockEntry()
+        entry.refs += 1
+        try:
+            if entry.lock.locked():
+                self.contended += 1
+                start = time.perf_counter()
+                await entry.lock.acquire()
+                wait_ms = (time.perf_counter() - start) * 1000
+                self.total_wait_ms += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            else:
+                await entry.lock.acquire()
+        except BaseException:
+            self._release_ref(conv_key, entry)
+            raise
+        self.acquisitions += 1
+        try:
+            yield
+        finally:
+            entry.lock.release()
+            self._release_ref(conv_key, entry)
+
+    def metrics(self) -> dict:
+        return {
+            "active_locks": len(self._entries),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": round(self.total_wait_ms / self.contended, 2) if self.contended else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
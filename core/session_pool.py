@@ -0,0 +1,165 @@
+"""
+预热 Session 池：为最近使用过的账户提前创建空闲的 Google Session。
+
+新对话直接取用池中的 Session，widgetCreateSession 不再出现在首字延迟里；
+取用后在后台补充到配置的深度，超过最长存活时间的 Session 直接丢弃。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Awaitable, Callable, Deque, Dict, Iterable, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from core.account import AccountManager
+
+logger = logging.getLogger(__name__)
+
+# 最近多久内取用过 Session 的账户才保持预热
+POOL_HOT_SECONDS = 600
+
+
+class SessionPool:
+    """按账户划分的预热 Session 池"""
+
+    def __init__(
+        self,
+        create: Callable[["AccountManager"], Awaitable[str]],
+        depth: int = 1,
+        max_age_seconds: float = 600,
+        max_concurrency: int = 4,
+    ) -> None:
+        self._create = create
+        self.depth = depth
+        self.max_age_seconds = max_age_seconds
+        # account_id -> [(session_name, created_at)]，左侧最旧
+        self._pools: Dict[str, Deque[Tuple[str, float]]] = {}
+        self._last_taken: Dict[str, float] = {}
+        self._refilling: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.last_refill_ms = 0.0
+        self._refill_total_ms = 0.0
+
+    def configure(self, depth: int, max_age_seconds: float) -> None:
+        self.depth = depth
+        self.max_age_seconds = max_age_seconds
+        if depth <= 0:
+            self._pools.clear()
+
+    def _prune(self, account_id: str, now: float) -> Deque[Tuple[str, float]]:
+        pool = self._pools.setdefault(account_id, deque())
+        while pool and now - pool[0][1] > self.max_age_seconds:
+            pool.popleft()
+            self.expired += 1
+        return pool
+
+    def take(self, account: "AccountManager") -> Optional[str]:
+        """取出一个预热 Session（没有时返回 None），并在后台补充"""
+        if self.depth <= 0:
+            return None
+        account_id = account.config.account_id
+        if not self._is_usable(account):
+            # 账户冷却/禁用/过期：不发放也不补充，恢复后由取用或维护任务重新预热
+            self._pools.pop(account_id, None)
+            self.misses += 1
+            return None
+        now = time.time()
+        self._last_taken[account_id] = now
+        pool = self._prune(account_id, now)
+        session = pool.popleft()[0] if pool else None
+        if session:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self._schedule_refill(account)
+        return session
+
+    def _is_usable(self, account: "AccountManager") -> bool:
+        return account.is_available and not account.config.disabled and not account.config.is_expired()
+
+    def _schedule_refill(self, account: "AccountManager") -> None:
+        account_id = account.config.account_id
+        if account_id in self._refilling:
+            return
+        self._refilling.add(account_id)
+        task = asyncio.create_task(self._refill(account))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, account: "AccountManager") -> None:
+        account_id = account.config.account_id
+        try:
+            while self._is_usable(account):
+                pool = self._prune(account_id, time.time())
+                if len(pool) >= self.depth:
+                    break
+                start = time.perf_counter()
+                try:
+                    async with self._semaphore:
+                        session = await self._create(account)
+                except Exception as e:
+                    # 补充失败不影响账户状态，下次取用或维护时再尝试
+                    self.refill_errors += 1
+                    logger.warning(
+                        f"[SESSION] [{account_id}] 预热Session创建失败: {type(e).__name__}: {str(e)[:100]}"
+                    )
+                    break
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if not self._is_usable(account):
+                    # 创建期间账户进入冷却或被禁用，丢弃结果
+                    break
+                self.refills += 1
+                self.last_refill_ms = elapsed_ms
+                self._refill_total_ms += elapsed_ms
+                self._pools.setdefault(account_id, deque()).append((session, time.time()))
+        finally:
+            self._refilling.discard(account_id)
+
+    async def run_maintenance(
+        self, get_accounts: Callable[[], Iterable["AccountManager"]], interval: float = 30.0
+    ) -> None:
+        """定期丢弃过期 Session，并为热账户补充被丢弃的部分"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                if self.depth <= 0:
+                    continue
+                now = time.time()
+                accounts = {account.config.account_id: account for account in list(get_accounts())}
+                for account_id in list(self._pools):
+                    pool = self._prune(account_id, now)
+                    if not pool or account_id not in accounts:
+                        del self._pools[account_id]
+                for account_id, last_taken in list(self._last_taken.items()):
+                    account = accounts.get(account_id)
+                    if account is None or now - last_taken > POOL_HOT_SECONDS:
+                        del self._last_taken[account_id]
+                        continue
+                    if len(self._pools.get(account_id, ())) < self.depth and self._is_usable(account):
+                        self._schedule_refill(account)
+        except asyncio.CancelledError:
+            logger.info("[SESSION] 预热Session维护任务已停止")
+
+    def metrics(self) -> dict:
+        taken = self.hits + self.misses
+        return {
+            "depth": self.depth,
+            "max_age_seconds": self.max_age_seconds,
+            "pooled_sessions": sum(len(pool) for pool in self._pools.values()),
+            "warm_accounts": sum(1 for pool in self._pools.values() if pool),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / taken, 3) if taken else 0.0,
+            "expired": self.expired,
+            "refills": self.refills,
+            "refill_errors": self.refill_errors,
+            "last_refill_ms": round(self.last_refill_ms, 1),
+            "avg_refill_ms": round(self._refill_total_ms / self.refills, 1) if self.refills else 0.0,
+        }
@@ -0,0 +1,121 @@
+"""
+按时间分桶的计数器：固定长度的分钟 / 小时环形数组，更新和查询都是 O(1)。
+
+替代原先逐条保存请求时间戳的列表，内存占用与请求量无关。
+"""
+
+import time
+from typing import Dict, Iterable, List, Optional
+
+# 默认保留最近 120 分钟、48 小时
+MINUTE_SLOTS = 120
+HOUR_SLOTS = 48
+
+
+class _Ring:
+    """单一粒度的环形计数数组：slot = bucket % size，bucket 不匹配即视为过期"""
+
+    __slots__ = ("width", "size", "buckets", "counts")
+
+    def __init__(self, width: int, size: int) -> None:
+        self.width = width
+        self.size = size
+        self.buckets: List[int] = [-1] * size
+        self.counts: List[int] = [0] * size
+
+    def add(self, ts: float, n: int) -> None:
+        bucket = int(ts // self.width)
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket:
+            self.buckets[slot] = bucket
+            self.counts[slot] = 0
+        self.counts[slot] += n
+
+    def get(self, bucket: int) -> int:
+        slot = bucket % self.size
+        return self.counts[slot] if self.buckets[slot] == bucket else 0
+
+    def to_list(self) -> List[List[int]]:
+        return [[b, c] for b, c in zip(self.buckets, self.counts) if b >= 0 and c]
+
+    def load(self, items: Iterable) -> None:
+        for item in items:
+            try:
+                bucket, count = int(item[0]), int(item[1])
+            except (TypeError, ValueError, IndexError):
+                continue
+            slot = bucket % self.size
+            # 同一槽位只保留较新的桶
+            if bucket >= self.buckets[slot]:
+                if self.buckets[slot] != bucket:
+                    self.counts[slot] = 0
+                self.buckets[slot] = bucket
+                self.counts[slot] += count
+
+
+class TimeBucketCounter:
+    """一个统计序列的分钟级 + 小时级计数"""
+
+    __slots__ = ("_minutes", "_hours")
+
+    def __init__(self, minute_slots: int = MINUTE_SLOTS, hour_slots: int = HOUR_SLOTS) -> None:
+        self._minutes = _Ring(60, minute_slots)
+        self._hours = _Ring(3600, hour_slots)
+
+    def add(self, ts: Optional[float] = None, n: int = 1) -> None:
+        if ts is None:
+            ts = time.time()
+        self._minutes.add(ts, n)
+        self._hours.add(ts, n)
+
+    def last_minute(self, now: Optional[float] = None) -> int:
+        """最近 60 秒的估算值：当前分钟 + 上一分钟按剩余比例折算（滑动窗口近似）"""
+        if now is None:
+            now = time.time()
+        bucket = int(now // 60)
+        elapsed = (now % 60) / 60
+        previous = self._minutes.get(bucket - 1)
+        return int(round(self._minutes.get(bucket) + previous * (1 - elapsed)))
+
+    def minutely(self, count: int, now: Optional[float] = None) -> List[int]:
+        """最近 count 个分钟桶（旧 -> 新，最后一个为当前分钟）"""
+        if now is None:
+            now = time.time()
+        last = int(now // 60)
+        return [self._minutes.get(b) for b in range(last - count + 1, last + 1)]
+
+    def hourly(self, start_ts: float, count: int) -> List[int]:
+        """从 start_ts 所在小时开始的 count 个小时桶"""
+        first = int(start_ts // 3600)
+        return [self._hours.get(b) for b in range(first, first + count)]
+
+    def to_dict(self) -> Dict[str, list]:
+        return {"minutes": self._minutes.to_list(), "hours": self._hours.to_list()}
+
+    @classmethod
+    def from_dict(cls, data: object) -> "TimeBucketCounter":
+        counter = cls()
+        if isinstance(data, dict):
+            counter._minutes.load(data.get("minutes") or [])
+            counter._hours.load(data.get("hours") or [])
+        return counter
+
+    @classmethod
+    def from_timestamps(cls, timestamps: Iterable) -> "TimeBucketCounter":
+        """从旧版时间戳列表迁移"""
+        counter = cls()
+        for ts in timestamps:
+            if isinstance(ts, (int, float)):
+                counter.add(float(ts))
+        return counter
+
+
+def load_counter(data: Optional[dict], new_key: str, legacy_key: str) -> TimeBucketCounter:
+    """读取计数器；只有旧版时间戳列表时自动迁移"""
+    value = (data or {}).get(new_key)
+    if isinstance(value, dict):
+        return TimeBucketCounter.from_dict(value)
+    legacy = (data or {}).get(legacy_key)
+    if isinstance(legacy, (list, tuple)):
+        return TimeBucketCounter.from_timestamps(legacy)
+    return TimeBucketCounter()
@@ -0,0 +1,71 @@
+"""
+上下文文件上传缓存：按 (Session, 文件内容摘要) 记录已上传的 fileId。
+
+同一 Session 内再次出现相同的附件（重试、后续轮次重复发送）时直接复用 fileId，
+不再重复上传整个 base64 内容。fileId 绑定在 Session 上，换 Session 后自然不命中。
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+UPLOAD_CACHE_MAX_ENTRIES = 4096
+UPLOAD_CACHE_TTL_SECONDS = 3600
+
+
+def content_digest(base64_content: str) -> str:
+    """附件内容摘要（直接对 base64 文本计算，不解码）"""
+    return hashlib.blake2b(base64_content.encode("ascii", "ignore"), digest_size=16).hexdigest()
+
+
+class UploadCache:
+    """(session_name, 内容摘要) -> fileId 的 LRU + TTL 缓存"""
+
+    def __init__(
+        self,
+        max_entries: int = UPLOAD_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = UPLOAD_CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # (session_name, digest) -> (fileId, 写入时间)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def get(self, session_name: str, digest: str, size: int = 0) -> Optional[str]:
+        key = (session_name, digest)
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += size
+        return entry[0]
+
+    def put(self, session_name: str, digest: str, file_id: str) -> None:
+        key = (session_name, digest)
+        self._entries[key] = (file_id, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -5,16 +5,21 @@ Uptime 实时监控与心跳历史持久化。
 from collections import deque
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional
+import asyncio
 import json
 import os
 from threading import Lock
 
+from core.write_behind import WriteBehindPersister
+
 # 北京时区 UTC+8
 BEIJING_TZ = timezone(timedelta(hours=8))
 
 # 每个服务保留最近 60 条心跳
 MAX_HEARTBEATS = 60
 SLOW_THRESHOLD_MS = 40000
+# 心跳写盘的最小间隔（秒）
+SAVE_INTERVAL_SECONDS = 3.0
 WARNING_STATUS_CODES = {429}
 
 _storage_path: Optional[str] = None
@@ -47,18 +52,41 @@ def _classify_level(success: bool, status_code: Optional[int], latency_ms: Optio
     return "up" if success else "down"
 
 
-def _save_heartbeats() -> None:
-    if not _storage_path:
-        return
-    try:
-        payload = {}
-        for service_id, service_data in SERVICES.items():
-            payload[service_id] = list(service_data["heartbeats"])
-        os.makedirs(os.path.dirname(_storage_path), exist_ok=True)
-        with _storage_lock, open(_storage_path, "w", encoding="utf-8") as f:
+def _write_heartbeats_file(path: str, payload: Dict[str, list]) -> None:
+    """原子写入：先写临时文件再 rename，进程中途退出也不会留下半个文件"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with _storage_lock:
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(payload, f, ensure_ascii=True, indent=2)
-    except Exception:
+        os.replace(tmp_path, path)
+
+
+async def _save_heartbeats() -> None:
+    if not _storage_path:
         return
+    # 在事件循环中生成快照，序列化和磁盘 IO 放到线程里
+    payload = {
+        service_id: list(service_data["heartbeats"])
+        for service_id, service_data in SERVICES.items()
+    }
+    await asyncio.to_thread(_write_heartbeats_file, _storage_path, payload)
+
+
+# 心跳只在内存中追加，后台任务最多每 SAVE_INTERVAL_SECONDS 秒写一次盘
+_persister = WriteBehindPersister(
+    "uptime", _save_heartbeats, interval=SAVE_INTERVAL_SECONDS, max_pending=None
+)
+
+
+def start_persistence() -> None:
+    """启动后台写盘任务（需在事件循环中调用）"""
+    _persister.start()
+
+
+async def stop_persistence() -> None:
+    """停止后台写盘任务并写回剩余心跳"""
+    await _persister.stop()
 
 
 def load_heartbeats() -> None:
@@ -99,7 +127,7 @@ def record_request(
         heartbeat["status_code"] = status_code
 
     SERVICES[service]["heartbeats"].append(heartbeat)
-    _save_heartbeats()
+    _persister.mark_dirty()
 
 
 def get_realtime_status() -> Dict:
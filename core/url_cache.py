@@ -0,0 +1,154 @@
+"""
+URL 附件下载缓存与增量 base64 编码。
+
+- UrlDownloadCache：URL -> (MIME, base64, ETag/Last-Modified) 的 LRU + TTL 缓存，
+  按条目数和 base64 总字节数限制容量。TTL 内直接复用；过期后带 If-None-Match /
+  If-Modified-Since 重新验证，上游返回 304 时继续复用
+- Base64Buffer：边下载边编码，按 Content-Length 预分配输出缓冲，不保留原始字节
+"""
+
+import base64
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+URL_CACHE_MAX_ENTRIES = 256
+URL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+URL_CACHE_TTL_SECONDS = 300
+
+
+class Base64Buffer:
+    """增量 base64 编码：每次只编码 3 字节对齐的部分，余下的字节留到下一块"""
+
+    __slots__ = ("_buf", "_pos", "_pending", "size")
+
+    def __init__(self, expected_size: Optional[int] = None) -> None:
+        self._buf = bytearray(4 * ((expected_size + 2) // 3)) if expected_size else bytearray()
+        self._pos = 0
+        self._pending = b""
+        self.size = 0  # 已接收的原始字节数
+
+    def _write(self, encoded: bytes) -> None:
+        end = self._pos + len(encoded)
+        if end <= len(self._buf):
+            self._buf[self._pos:end] = encoded
+        else:
+            # 实际大小超出 Content-Length 时改为追加
+            del self._buf[self._pos:]
+            self._buf += encoded
+        self._pos = end
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        data = self._pending + chunk if self._pending else chunk
+        aligned = len(data) - len(data) % 3
+        if aligned:
+            self._write(base64.b64encode(data[:aligned]))
+        self._pending = data[aligned:]
+
+    def getvalue(self) -> str:
+        if self._pending:
+            self._write(base64.b64encode(self._pending))
+            self._pending = b""
+        del self._buf[self._pos:]
+        return self._buf.decode("ascii")
+
+
+class UrlDownloadCache:
+    """URL 下载结果的 LRU + TTL 缓存"""
+
+    def __init__(
+        self,
+        max_entries: int = URL_CACHE_MAX_ENTRIES,
+        max_bytes: int = URL_CACHE_MAX_BYTES,
+        ttl_seconds: float = URL_CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # url -> {"mime", "data", "etag", "last_modified", "size", "fetched_at"}
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """返回缓存条目（可能已过 TTL，调用方用 is_fresh 判断是否需要重新验证）"""
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] <= self.ttl_seconds
+
+    def validators(self, entry: Optional[dict]) -> Dict[str, str]:
+        """重新验证用的条件请求头"""
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def hit(self, entry: dict, revalidated: bool = False) -> dict:
+        """记录一次命中（revalidated 表示经过 304 重新验证）"""
+        self.hits += 1
+        self.bytes_saved += entry["size"]
+        if revalidated:
+            self.revalidated += 1
+            entry["fetched_at"] = time.time()
+        return entry
+
+    def store(
+        self,
+        url: str,
+        mime: str,
+        data: str,
+        size: int,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        self.misses += 1
+        old = self._entries.pop(url, None)
+        if old is not None:
+            self._total_bytes -= len(old["data"])
+        if len(data) > self.max_bytes:
+            return
+        self._entries[url] = {
+            "mime": mime,
+            "data": data,
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": size,
+            "fetched_at": time.time(),
+        }
+        self._total_bytes += len(data)
+        while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= len(evicted["data"])
+            self.evictions += 1
+
+    def discard(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._total_bytes -= len(entry["data"])
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "cached_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,115 @@
+"""
+Write-behind 持久化：热路径只标记脏数据，由后台任务按时间间隔或变更次数批量写回。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("gemini.write_behind")
+
+
+class WriteBehindPersister:
+    """把频繁变化的内存状态合并后写回存储
+
+    - mark_dirty() 只做计数，不加锁、不做 IO，可在请求热路径上直接调用
+    - 后台任务每 interval 秒写一次；累计变更达到 max_pending 时提前写（None 表示只按时间写）
+    - stop() 取消后台任务并同步写回剩余的变更（用于进程退出）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        save: Callable[[], Awaitable[None]],
+        interval: float = 5.0,
+        max_pending: Optional[int] = 200,
+    ) -> None:
+        self.name = name
+        self._save = save
+        self._interval = interval
+        self._max_pending = max_pending
+        self._pending = 0
+        self._oldest_dirty_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flush_count = 0
+        self.error_count = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def mark_dirty(self, count: int = 1) -> None:
+        """标记有 count 次变更待写回"""
+        if not self._pending:
+            self._oldest_dirty_at = time.time()
+        self._pending += count
+        if self._max_pending is not None and self._pending >= self._max_pending:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if self._pending:
+                    await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self) -> None:
+        """立即写回（没有变更时直接返回）"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, 0
+            self._oldest_dirty_at = None
+            start = time.perf_counter()
+            try:
+                await self._save()
+            except Exception as e:
+                # 写失败时保留脏标记，下个周期重试
+                self.error_count += 1
+                self.mark_dirty(pending)
+                logger.error(f"[PERSIST] [{self.name}] 写回失败: {type(e).__name__}: {str(e)[:100]}")
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flush_count += 1
+            self.last_flush_at = time.time()
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    async def stop(self) -> None:
+        """停止后台任务并写回剩余变更"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def metrics(self) -> dict:
+        now = time.time()
+        return {
+            "pending_changes": self._pending,
+            "oldest_pending_seconds": round(now - self._oldest_dirty_at, 1)
+            if self._oldest_dirty_at
+            else 0.0,
+            "flush_interval_seconds": self._interval,
+            "flush_max_pending": self._max_pending,
+            "flush_count": self.flush_count,
+            "flush_errors": self.error_count,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "last_flush_at": self.last_flush_at,
+        }
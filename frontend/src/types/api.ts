@@ -29,11 +29,37 @@ export interface AdminAccount {
   cooldown_reason: string | null
   conversation_count: number
   quota_status: AccountQuotaStatus
+  load?: AccountLoad
+  jwt?: AccountJwtMetrics | null
 }
 
+export interface AccountJwtMetrics {
+  refresh_count: number
+  refresh_errors: number
+  prefresh_count: number
+  last_refresh_ms: number
+  avg_refresh_ms: number
+  max_refresh_ms: number
+  expires_in_seconds: number
+}
+
+export interface AccountLoad {
+  in_flight: number
+  ewma_ttfb_ms: number | null
+  ewma_latency_ms: number | null
+}
+
+export type SchedulingPolicy = 'round_robin' | 'least_inflight' | 'p2c_latency' | 'weighted'
+
 export interface AccountsListResponse {
   total: number
   accounts: AdminAccount[]
+  scheduler?: {
+    policy: SchedulingPolicy
+    ready_accounts: number
+    total_accounts: number
+    pending_timers: number
+  }
 }
 
 export interface AccountConfigItem {
@@ -80,6 +106,13 @@ export interface Settings {
     refresh_window_hours?: number
     register_default_count?: number
     register_domain?: string
+    fast_stream_parser?: boolean
+    stream_flush_window_ms?: number
+    stream_flush_bytes?: number
+    session_pool_depth?: number
+    session_pool_max_age_seconds?: number
+    upload_concurrency_per_account?: number
+    url_download_max_mb?: number
   }
   retry: {
     max_new_session_tries: number
@@ -88,7 +121,9 @@ export interface Settings {
     account_failure_threshold: number
     rate_limit_cooldown_seconds: number
     session_cache_ttl_seconds: number
+    session_cache_max_entries?: number
     auto_refresh_accounts_seconds: number
+    scheduling_policy?: SchedulingPolicy
   }
   public_display: {
     logo_url?: string
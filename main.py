@@ -1,4 +1,4 @@
-import json, time, os, asyncio, uuid, ssl, re, yaml, shutil, base64
+import json, time, os, asyncio, uuid, ssl, yaml, shutil, base64
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Union, Dict, Any
 from pathlib import Path
@@ -12,7 +12,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from util.streaming_parser import parse_json_array_stream_async
+from util.streaming_parser import (
+    JsonArrayStreamDecoder,
+    KeepAliveStream,
+    parse_json_array_stream_async,
+)
+from util.sse import ChunkEncoder, DeltaCoalescer
 from collections import deque
 from threading import Lock
 
@@ -51,11 +56,13 @@ from core.session_auth import (
 
 # 导入核心模块
 from core.message import (
-    get_conversation_key,
+    extend_history_key,
+    get_history_keys,
     parse_last_message,
     build_full_context_text,
 )
 from core.google_api import (
+    GEMINI_API_BASE,
     get_common_headers,
     create_google_session,
     upload_context_file,
@@ -84,6 +91,15 @@ from core.config import config_manager, config
 
 # 数据库存储支持
 from core import storage
+from core.write_behind import WriteBehindPersister
+from core.time_buckets import TimeBucketCounter, load_counter
+from core.request_events import RequestEventLog
+from core.scheduler import SCHEDULING_POLICIES
+from core.jwt import run_prefresh_loop
+from core.public_cache import PublicResponseCache, VisitorTracker
+from core.session_pool import SessionPool
+from core.upload_cache import UploadCache, content_digest
+from core.url_cache import UrlDownloadCache
 
 # 模型到配额类型的映射
 MODEL_TO_QUOTA_TYPE = {"gemini-imagen": "images", "gemini-veo": "videos"}
@@ -94,8 +110,11 @@ MODEL_TO_QUOTA_TYPE = {"gemini-imagen": "images", "gemini-veo": "videos"}
 log_buffer = deque(maxlen=1000)
 log_lock = Lock()
 
-# 统计数据持久化
-stats_lock = asyncio.Lock()  # 改为异步锁
+# 请求生命周期时间线（按 request_id 索引，供 /public/log 直接读取）
+request_events = RequestEventLog(max_requests=1000)
+
+# 公开端点的短 TTL 响应缓存（轮询和爬虫不再与聊天请求争用统计数据）
+public_cache = PublicResponseCache(ttl=2.0)
 
 
 async def load_stats():
@@ -122,40 +141,65 @@ async def load_stats():
         data = {
             "total_visitors": 0,
             "total_requests": 0,
-            "request_timestamps": [],
-            "model_request_timestamps": {},
-            "failure_timestamps": [],
-            "rate_limit_timestamps": [],
             "visitor_ips": {},
             "account_conversations": {},
             "recent_conversations": [],
         }
 
-    # 将列表转换为 deque（限制大小防止内存无限增长）
-    if isinstance(data.get("request_timestamps"), list):
-        data["request_timestamps"] = deque(data["request_timestamps"], maxlen=20000)
-    if isinstance(data.get("failure_timestamps"), list):
-        data["failure_timestamps"] = deque(data["failure_timestamps"], maxlen=10000)
-    if isinstance(data.get("rate_limit_timestamps"), list):
-        data["rate_limit_timestamps"] = deque(
-            data["rate_limit_timestamps"], maxlen=10000
-        )
+    # 24 小时访客去重表
+    data["visitor_ips"] = VisitorTracker.from_dict(data.get("visitor_ips"))
+
+    # 请求/失败/限流计数使用分钟 + 小时分桶（旧版时间戳列表自动迁移）
+    data["request_counts"] = load_counter(data, "request_counts", "request_timestamps")
+    data["failure_counts"] = load_counter(data, "failure_counts", "failure_timestamps")
+    data["rate_limit_counts"] = load_counter(
+        data, "rate_limit_counts", "rate_limit_timestamps"
+    )
+    model_counts = data.get("model_request_counts")
+    legacy_model_ts = data.get("model_request_timestamps")
+    if isinstance(model_counts, dict):
+        data["model_request_counts"] = {
+            model: TimeBucketCounter.from_dict(value)
+            for model, value in model_counts.items()
+        }
+    elif isinstance(legacy_model_ts, dict):
+        data["model_request_counts"] = {
+            model: TimeBucketCounter.from_timestamps(timestamps or [])
+            for model, timestamps in legacy_model_ts.items()
+        }
+    else:
+        data["model_request_counts"] = {}
+    for legacy_key in (
+        "request_timestamps",
+        "failure_timestamps",
+        "rate_limit_timestamps",
+        "model_request_timestamps",
+    ):
+        data.pop(legacy_key, None)
 
     return data
 
 
 async def save_stats(stats):
     """保存统计数据（异步，避免阻塞事件循环）"""
-    # 将 deque 转换为 list 以便 JSON 序列化
-    stats_to_save = stats.copy()
-    if isinstance(stats_to_save.get("request_timestamps"), deque):
-        stats_to_save["request_timestamps"] = list(stats_to_save["request_timestamps"])
-    if isinstance(stats_to_save.get("failure_timestamps"), deque):
-        stats_to_save["failure_timestamps"] = list(stats_to_save["failure_timestamps"])
-    if isinstance(stats_to_save.get("rate_limit_timestamps"), deque):
-        stats_to_save["rate_limit_timestamps"] = list(
-            stats_to_save["rate_limit_timestamps"]
-        )
+    # 同步生成快照：deque 转 list 以便 JSON 序列化，嵌套容器也复制一层，
+    # 避免数据库模式在线程中序列化时与请求路径的修改并发
+    stats_to_save = {}
+    for key, value in stats.items():
+        if isinstance(value, (TimeBucketCounter, VisitorTracker)):
+            value = value.to_dict()
+        elif isinstance(value, (deque, list)):
+            value = list(value)
+        elif isinstance(value, dict):
+            value = {
+                k: v.to_dict()
+                if isinstance(v, TimeBucketCounter)
+                else list(v)
+                if isinstance(v, (deque, list))
+                else v
+                for k, v in value.items()
+            }
+        stats_to_save[key] = value
 
     if storage.is_database_enabled():
         try:
@@ -171,19 +215,32 @@ async def save_stats(stats):
         logger.error(f"[STATS] 保存统计数据失败: {str(e)[:50]}")
 
 
+async def _flush_global_stats():
+    await save_stats(global_stats)
+
+
+# 统计数据写回：请求路径只标记变更，后台每 5 秒或累计 200 次变更写一次
+stats_persister = WriteBehindPersister(
+    "stats", _flush_global_stats, interval=5.0, max_pending=200
+)
+
+
 # 初始化统计数据（需要在启动时异步加载）
 global_stats = {
     "total_visitors": 0,
     "total_requests": 0,
-    "request_timestamps": deque(maxlen=20000),
-    "model_request_timestamps": {},
-    "failure_timestamps": deque(maxlen=10000),
-    "rate_limit_timestamps": deque(maxlen=10000),
-    "visitor_ips": {},
+    "request_counts": TimeBucketCounter(),
+    "model_request_counts": {},
+    "failure_counts": TimeBucketCounter(),
+    "rate_limit_counts": TimeBucketCounter(),
+    "visitor_ips": VisitorTracker(),
     "account_conversations": {},
     "recent_conversations": [],
 }
 
+# 流式输出计数（仅运行期，不持久化）：上游增量条数 / 实际发送的 SSE 帧数
+stream_stats = {"deltas": 0, "frames": 0}
+
 
 def get_beijing_time_str(ts: Optional[float] = None) -> str:
     tz = timezone(timedelta(hours=8))
@@ -447,6 +504,84 @@ multi_account_mgr = load_multi_account_config(
     SESSION_CACHE_TTL_SECONDS,
     global_stats,
 )
+multi_account_mgr.scheduler.set_policy(config_manager.scheduling_policy)
+multi_account_mgr.global_session_cache.configure(
+    max_entries=config_manager.session_cache_max_entries
+)
+
+async def create_pooled_session(account_manager: AccountManager) -> str:
+    """后台预热用：JWT 不经过 get_jwt，成功或失败都不改变账户的可用/冷却状态"""
+    jwt = await account_manager.get_jwt_untracked()
+    return await create_google_session(
+        account_manager, http_client, USER_AGENT, jwt=jwt
+    )
+
+
+# 预热 Session 池（按账户划分，账户重载后按 account_id 继续使用）
+session_pool = SessionPool(
+    create_pooled_session,
+    depth=config_manager.session_pool_depth,
+    max_age_seconds=config_manager.session_pool_max_age_seconds,
+)
+
+
+async def acquire_google_session(
+    account_manager: AccountManager, request_id: str = ""
+) -> str:
+    """新对话优先取用预热的 Session，池为空时同步创建"""
+    session = session_pool.take(account_manager)
+    if session:
+        logger.info(
+            f"[SESSION] [{account_manager.config.account_id}] [req_{request_id}] 使用预热Session: {session[-12:]}"
+        )
+        return session
+    return await create_google_session(
+        account_manager, http_client, USER_AGENT, request_id
+    )
+
+
+# 已上传附件的 fileId 缓存（按 Session + 内容摘要）
+upload_cache = UploadCache()
+# URL 附件下载缓存（按 URL，过期后按 ETag 重新验证）
+url_download_cache = UrlDownloadCache()
+
+
+async def upload_attachments(
+    session_name: str,
+    files: List[Dict[str, Any]],
+    account_manager: AccountManager,
+    request_id: str = "",
+) -> List[str]:
+    """并发上传附件到指定 Session（已上传过的相同内容直接复用 fileId），按输入顺序返回 fileId
+
+    同一账户上所有请求的上传共用并发上限（upload_concurrency_per_account）
+    """
+    semaphore = account_manager.upload_semaphore(
+        config_manager.upload_concurrency_per_account
+    )
+
+    async def upload_one(file: Dict[str, Any]) -> str:
+        # 摘要只计算一次，重试/切换 Session 时复用
+        digest = file.get("digest")
+        if digest is None:
+            digest = file["digest"] = content_digest(file["data"])
+        file_id = upload_cache.get(session_name, digest, len(file["data"]))
+        if file_id:
+            return file_id
+        async with semaphore:
+            file_id = await upload_context_file(
+                session_name,
+                file["mime"],
+                file["data"],
+                account_manager,
+                http_client,
+                USER_AGENT,
+                request_id,
+            )
+        upload_cache.put(session_name, digest, file_id)
+        return file_id
+
+    return list(await asyncio.gather(*(upload_one(file) for file in files)))
 
 # ---------- 自动注册/刷新服务 ----------
 register_service = None
@@ -789,21 +924,28 @@ async def startup_event():
 
     # 加载统计数据
     global_stats = await load_stats()
-    global_stats.setdefault("request_timestamps", [])
-    global_stats.setdefault("model_request_timestamps", {})
-    global_stats.setdefault("failure_timestamps", [])
-    global_stats.setdefault("rate_limit_timestamps", [])
     global_stats.setdefault("recent_conversations", [])
     uptime_tracker.configure_storage(os.path.join(DATA_DIR, "uptime.json"))
     uptime_tracker.load_heartbeats()
+    uptime_tracker.start_persistence()
     logger.info(
         f"[SYSTEM] 统计数据已加载: {global_stats['total_requests']} 次请求, {global_stats['total_visitors']} 位访客"
     )
+    stats_persister.start()
 
     # 启动缓存清理任务
     asyncio.create_task(multi_account_mgr.start_background_cleanup())
     logger.info("[SYSTEM] 后台缓存清理任务已启动（间隔: 5分钟）")
 
+    # 启动预热 Session 维护任务（丢弃过期 Session 并为热账户补充）
+    asyncio.create_task(
+        session_pool.run_maintenance(lambda: multi_account_mgr.accounts.values())
+    )
+
+    # 启动 JWT 预刷新任务（热账户在 token 到期前后台换新）
+    asyncio.create_task(run_prefresh_loop(lambda: multi_account_mgr.accounts.values()))
+    logger.info("[SYSTEM] JWT 预刷新任务已启动")
+
     # 启动自动刷新账号任务（仅数据库模式有效）
     if os.environ.get("ACCOUNTS_CONFIG"):
         logger.info("[SYSTEM] 自动刷新账号已跳过（使用 ACCOUNTS_CONFIG）")
@@ -826,230 +968,12 @@ async def startup_event():
         logger.info("[SYSTEM] 自动登录刷新未启用或依赖不可用")
 
 
-# ---------- 日志脱敏函数 ----------
-def get_sanitized_logs(limit: int = 100) -> list:
-    """获取脱敏后的日志列表，按请求ID分组并提取关键事件"""
-    with log_lock:
-        logs = list(log_buffer)
-
-    # 按请求ID分组（支持两种格式：带[req_xxx]和不带的）
-    request_logs = {}
-    orphan_logs = []  # 没有request_id的日志（如选择账户）
-
-    for log in logs:
-        message = log["message"]
-        req_match = re.search(r"\[req_([a-z0-9]+)\]", message)
-
-        if req_match:
-            request_id = req_match.group(1)
-            if request_id not in request_logs:
-                request_logs[request_id] = []
-            request_logs[request_id].append(log)
-        else:
-            # 没有request_id的日志（如选择账户），暂存
-            orphan_logs.append(log)
-
-    # 将orphan_logs（如选择账户）关联到对应的请求
-    # 策略：将orphan日志关联到时间上最接近的后续请求
-    for orphan in orphan_logs:
-        orphan_time = orphan["time"]
-        # 找到时间上最接近且在orphan之后的请求
-        closest_request_id = None
-        min_time_diff = None
-
-        for request_id, req_logs in request_logs.items():
-            if req_logs:
-                first_log_time = req_logs[0]["time"]
-                # orphan应该在请求之前或同时
-                if first_log_time >= orphan_time:
-                    if min_time_diff is None or first_log_time < min_time_diff:
-                        min_time_diff = first_log_time
-                        closest_request_id = request_id
-
-        # 如果找到最接近的请求，将orphan日志插入到该请求的日志列表开头
-        if closest_request_id:
-            request_logs[closest_request_id].insert(0, orphan)
-
-    # 为每个请求提取关键事件
-    sanitized = []
-    for request_id, req_logs in request_logs.items():
-        # 收集关键信息
-        model = None
-        message_count = None
-        retry_events = []
-        final_status = "in_progress"
-        duration = None
-        start_time = req_logs[0]["time"]
-
-        # 遍历该请求的所有日志
-        for log in req_logs:
-            message = log["message"]
-
-            # 提取模型名称和消息数量（开始对话）
-            if "收到请求:" in message and not model:
-                model_match = re.search(r"收到请求: ([^ |]+)", message)
-                if model_match:
-                    model = model_match.group(1)
-                count_match = re.search(r"(\d+)条消息", message)
-                if count_match:
-                    message_count = int(count_match.group(1))
-
-            # 提取重试事件（包括失败尝试、账户切换、选择账户）
-            # 注意：不提取"正在重试"日志，因为它和"失败 (尝试"是配套的
-            if any(
-                keyword in message for keyword in ["切换账户", "选择账户", "失败 (尝试"]
-            ):
-                retry_events.append({"time": log["time"], "message": message})
-
-            # 提取响应完成（最高优先级 - 最终成功则忽略中间错误）
-            if "响应完成:" in message:
-                time_match = re.search(r"响应完成: ([\d.]+)秒", message)
-                if time_match:
-                    duration = time_match.group(1) + "s"
-                    final_status = "success"
-
-            # 检测非流式响应完成
-            if "非流式响应完成" in message:
-                final_status = "success"
-
-            # 检测失败状态（仅在非success状态下）
-            if final_status != "success" and (
-                log["level"] == "ERROR" or "失败" in message
-            ):
-                final_status = "error"
-
-            # 检测超时（仅在非success状态下）
-            if final_status != "success" and "超时" in message:
-                final_status = "timeout"
-
-        # 如果没有模型信息但有错误，仍然显示
-        if not model and final_status == "in_progress":
-            continue
-
-        # 构建关键事件列表
-        events = []
-
-        # 1. 开始对话
-        if model:
-            events.append(
-                {
-                    "time": start_time,
-                    "type": "start",
-                    "content": f"{model} | {message_count}条消息"
-                    if message_count
-                    else model,
-                }
-            )
-        else:
-            # 没有模型信息但有错误的情况
-            events.append(
-                {"time": start_time, "type": "start", "content": "请求处理中"}
-            )
-
-        # 2. 重试事件
-        failure_count = 0  # 失败重试计数
-        account_select_count = 0  # 账户选择计数
-
-        for i, retry in enumerate(retry_events):
-            msg = retry["message"]
-
-            # 识别不同类型的重试事件（按优先级匹配）
-            if "失败 (尝试" in msg:
-                # 创建会话失败
-                failure_count += 1
-                events.append(
-                    {
-                        "time": retry["time"],
-                        "type": "retry",
-                        "content": f"服务异常，正在重试（{failure_count}）",
-                    }
-                )
-            elif "选择账户" in msg:
-                # 账户选择/切换
-                account_select_count += 1
-
-                # 检查下一条日志是否是"切换账户"，如果是则跳过当前"选择账户"（避免重复）
-                next_is_switch = (
-                    i + 1 < len(retry_events)
-                    and "切换账户" in retry_events[i + 1]["message"]
-                )
-
-                if not next_is_switch:
-                    if account_select_count == 1:
-                        # 第一次选择：显示为"选择服务节点"
-                        events.append(
-                            {
-                                "time": retry["time"],
-                                "type": "select",
-                                "content": "选择服务节点",
-                            }
-                        )
-                    else:
-                        # 第二次及以后：显示为"切换服务节点"
-                        events.append(
-                            {
-                                "time": retry["time"],
-                                "type": "switch",
-                                "content": "切换服务节点",
-                            }
-                        )
-            elif "切换账户" in msg:
-                # 运行时切换账户（显示为"切换服务节点"）
-                events.append(
-                    {"time": retry["time"], "type": "switch", "content": "切换服务节点"}
-                )
-
-        # 3. 完成事件
-        if final_status == "success":
-            if duration:
-                events.append(
-                    {
-                        "time": req_logs[-1]["time"],
-                        "type": "complete",
-                        "status": "success",
-                        "content": f"响应完成 | 耗时{duration}",
-                    }
-                )
-            else:
-                events.append(
-                    {
-                        "time": req_logs[-1]["time"],
-                        "type": "complete",
-                        "status": "success",
-                        "content": "响应完成",
-                    }
-                )
-        elif final_status == "error":
-            events.append(
-                {
-                    "time": req_logs[-1]["time"],
-                    "type": "complete",
-                    "status": "error",
-                    "content": "请求失败",
-                }
-            )
-        elif final_status == "timeout":
-            events.append(
-                {
-                    "time": req_logs[-1]["time"],
-                    "type": "complete",
-                    "status": "timeout",
-                    "content": "请求超时",
-                }
-            )
-
-        sanitized.append(
-            {
-                "request_id": request_id,
-                "start_time": start_time,
-                "status": final_status,
-                "events": events,
-            }
-        )
-
-    # 按时间排序并限制数量
-    sanitized.sort(key=lambda x: x["start_time"], reverse=True)
-    return sanitized[:limit]
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用退出时写回尚未持久化的统计数据和心跳"""
+    await stats_persister.stop()
+    await uptime_tracker.stop_persistence()
+    logger.info("[SYSTEM] 统计数据已写回")
 
 
 class Message(BaseModel):
@@ -1065,27 +989,6 @@ class ChatRequest(BaseModel):
     top_p: Optional[float] = 1.0
 
 
-def create_chunk(
-    id: str, created: int, model: str, delta: dict, finish_reason: Union[str, None]
-) -> str:
-    chunk = {
-        "id": id,
-        "object": "chat.completion.chunk",
-        "created": created,
-        "model": model,
-        "choices": [
-            {
-                "index": 0,
-                "delta": delta,
-                "logprobs": None,  # OpenAI 标准字段
-                "finish_reason": finish_reason,
-            }
-        ],
-        "system_fingerprint": None,  # OpenAI 标准字段（可选）
-    }
-    return json.dumps(chunk)
-
-
 # ---------- Auth endpoints (API) ----------
 
 
@@ -1112,9 +1015,6 @@ async def admin_logout(request: Request):
 @app.get("/admin/stats")
 @require_login()
 async def admin_stats(request: Request):
-    now = time.time()
-    window_seconds = 12 * 3600
-
     active_accounts = 0
     failed_accounts = 0
     rate_limited_accounts = 0
@@ -1148,59 +1048,14 @@ async def admin_stats(request: Request):
     start_ts = start_dt.timestamp()
     labels = [(start_dt + timedelta(hours=i)).strftime("%H:00") for i in range(12)]
 
-    def bucketize(timestamps: list) -> list:
-        buckets = [0] * 12
-        for ts in timestamps:
-            idx = int((ts - start_ts) // 3600)
-            if 0 <= idx < 12:
-                buckets[idx] += 1
-        return buckets
-
-    async with stats_lock:
-        global_stats.setdefault("request_timestamps", deque(maxlen=20000))
-        global_stats.setdefault("failure_timestamps", deque(maxlen=10000))
-        global_stats.setdefault("rate_limit_timestamps", deque(maxlen=10000))
-        global_stats.setdefault("model_request_timestamps", {})
-
-        # 清理过期数据，保持 deque 类型
-        cleaned_request_ts = [
-            ts for ts in global_stats["request_timestamps"] if now - ts < window_seconds
-        ]
-        global_stats["request_timestamps"] = deque(cleaned_request_ts, maxlen=20000)
-
-        cleaned_failure_ts = [
-            ts for ts in global_stats["failure_timestamps"] if now - ts < window_seconds
-        ]
-        global_stats["failure_timestamps"] = deque(cleaned_failure_ts, maxlen=10000)
-
-        cleaned_rate_limit_ts = [
-            ts
-            for ts in global_stats["rate_limit_timestamps"]
-            if now - ts < window_seconds
-        ]
-        global_stats["rate_limit_timestamps"] = deque(
-            cleaned_rate_limit_ts, maxlen=10000
-        )
-
-        model_request_timestamps = {}
-        for model, timestamps in global_stats["model_request_timestamps"].items():
-            model_request_timestamps[model] = [
-                ts for ts in timestamps if now - ts < window_seconds
-            ]
-        global_stats["model_request_timestamps"] = model_request_timestamps
-
-        await save_stats(global_stats)
-
-        request_timestamps = list(global_stats["request_timestamps"])
-        failure_timestamps = list(global_stats["failure_timestamps"])
-        rate_limit_timestamps = list(global_stats["rate_limit_timestamps"])
-        model_request_timestamps = global_stats.get("model_request_timestamps", {})
-        model_requests = {}
-        for model in MODEL_MAPPING.keys():
-            model_requests[model] = bucketize(model_request_timestamps.get(model, []))
-        for model, timestamps in model_request_timestamps.items():
-            if model not in model_requests:
-                model_requests[model] = bucketize(timestamps)
+    model_counts = global_stats["model_request_counts"]
+    model_requests = {}
+    for model in MODEL_MAPPING.keys():
+        counter = model_counts.get(model)
+        model_requests[model] = counter.hourly(start_ts, 12) if counter else [0] * 12
+    for model, counter in model_counts.items():
+        if model not in model_requests:
+            model_requests[model] = counter.hourly(start_ts, 12)
 
     return {
         "total_accounts": total_accounts,
@@ -1210,11 +1065,34 @@ async def admin_stats(request: Request):
         "idle_accounts": idle_accounts,
         "trend": {
             "labels": labels,
-            "total_requests": bucketize(request_timestamps),
-            "failed_requests": bucketize(failure_timestamps),
-            "rate_limited_requests": bucketize(rate_limit_timestamps),
+            "total_requests": global_stats["request_counts"].hourly(start_ts, 12),
+            "failed_requests": global_stats["failure_counts"].hourly(start_ts, 12),
+            "rate_limited_requests": global_stats["rate_limit_counts"].hourly(
+                start_ts, 12
+            ),
             "model_requests": model_requests,
         },
+        "persistence": stats_persister.metrics(),
+        "streaming": {
+            "flush_window_ms": config_manager.stream_flush_window_ms,
+            "flush_bytes": config_manager.stream_flush_bytes,
+            "deltas": stream_stats["deltas"],
+            "frames": stream_stats["frames"],
+            "coalesce_ratio": round(stream_stats["deltas"] / stream_stats["frames"], 2)
+            if stream_stats["frames"]
+            else 1.0,
+        },
+        "session_pool": session_pool.metrics(),
+        "upload_cache": upload_cache.metrics(),
+        "url_cache": url_download_cache.metrics(),
+        "session_cache": {
+            **multi_account_mgr.global_session_cache.metrics(),
+            "locks": multi_account_mgr.session_locks.metrics(),
+        },
+        "public_cache": {
+            **public_cache.metrics(),
+            "tracked_visitors": len(global_stats["visitor_ips"]),
+        },
     }
 
 
@@ -1247,10 +1125,18 @@ async def admin_get_accounts(request: Request):
                 "conversation_count": account_manager.conversation_count,
                 "session_usage_count": account_manager.session_usage_count,
                 "quota_status": quota_status,  # 新增配额状态
+                "load": account_manager.get_load_info(),
+                "jwt": account_manager.jwt_manager.metrics()
+                if account_manager.jwt_manager is not None
+                else None,
             }
         )
 
-    return {"total": len(accounts_info), "accounts": accounts_info}
+    return {
+        "total": len(accounts_info),
+        "accounts": accounts_info,
+        "scheduler": multi_account_mgr.scheduler.metrics(),
+    }
 
 
 @app.get("/admin/accounts-config")
@@ -1607,6 +1493,13 @@ async def admin_get_settings(request: Request):
             "refresh_window_hours": config.basic.refresh_window_hours,
             "register_default_count": config.basic.register_default_count,
             "register_domain": config.basic.register_domain,
+            "fast_stream_parser": config.basic.fast_stream_parser,
+            "stream_flush_window_ms": config.basic.stream_flush_window_ms,
+            "stream_flush_bytes": config.basic.stream_flush_bytes,
+            "session_pool_depth": config.basic.session_pool_depth,
+            "session_pool_max_age_seconds": config.basic.session_pool_max_age_seconds,
+            "upload_concurrency_per_account": config.basic.upload_concurrency_per_account,
+            "url_download_max_mb": config.basic.url_download_max_mb,
         },
         "image_generation": {
             "enabled": config.image_generation.enabled,
@@ -1621,7 +1514,9 @@ async def admin_get_settings(request: Request):
             "account_failure_threshold": config.retry.account_failure_threshold,
             "rate_limit_cooldown_seconds": config.retry.rate_limit_cooldown_seconds,
             "session_cache_ttl_seconds": config.retry.session_cache_ttl_seconds,
+            "session_cache_max_entries": config.retry.session_cache_max_entries,
             "auto_refresh_accounts_seconds": config.retry.auto_refresh_accounts_seconds,
+            "scheduling_policy": config.retry.scheduling_policy,
         },
         "public_display": {
             "logo_url": config.public_display.logo_url,
@@ -1660,6 +1555,17 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         basic.setdefault("refresh_window_hours", config.basic.refresh_window_hours)
         basic.setdefault("register_default_count", config.basic.register_default_count)
         basic.setdefault("register_domain", config.basic.register_domain)
+        basic.setdefault("fast_stream_parser", config.basic.fast_stream_parser)
+        basic.setdefault("stream_flush_window_ms", config.basic.stream_flush_window_ms)
+        basic.setdefault("stream_flush_bytes", config.basic.stream_flush_bytes)
+        basic.setdefault("session_pool_depth", config.basic.session_pool_depth)
+        basic.setdefault(
+            "session_pool_max_age_seconds", config.basic.session_pool_max_age_seconds
+        )
+        basic.setdefault(
+            "upload_concurrency_per_account", config.basic.upload_concurrency_per_account
+        )
+        basic.setdefault("url_download_max_mb", config.basic.url_download_max_mb)
         if not isinstance(basic.get("register_domain"), str):
             basic["register_domain"] = ""
         basic.pop("duckmail_proxy", None)
@@ -1687,6 +1593,11 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         retry.setdefault(
             "auto_refresh_accounts_seconds", config.retry.auto_refresh_accounts_seconds
         )
+        retry.setdefault(
+            "session_cache_max_entries", config.retry.session_cache_max_entries
+        )
+        if retry.get("scheduling_policy") not in SCHEDULING_POLICIES:
+            retry["scheduling_policy"] = config.retry.scheduling_policy
         new_settings["retry"] = retry
 
         # 保存旧配置用于对比
@@ -1721,6 +1632,13 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         SESSION_CACHE_TTL_SECONDS = config.retry.session_cache_ttl_seconds
         AUTO_REFRESH_ACCOUNTS_SECONDS = config.retry.auto_refresh_accounts_seconds
         SESSION_EXPIRE_HOURS = config.session.expire_hours
+        multi_account_mgr.scheduler.set_policy(config.retry.scheduling_policy)
+        multi_account_mgr.global_session_cache.configure(
+            max_entries=config.retry.session_cache_max_entries
+        )
+        session_pool.configure(
+            config.basic.session_pool_depth, config.basic.session_pool_max_age_seconds
+        )
 
         # 检查是否需要重建 HTTP 客户端（代理变化）
         if old_proxy_for_auth != PROXY_FOR_AUTH or old_proxy_for_chat != PROXY_FOR_CHAT:
@@ -1787,10 +1705,14 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         if retry_changed:
             logger.info(f"[CONFIG] 重试策略已变化，更新账户管理器配置")
             # 更新所有账户管理器的配置
-            multi_account_mgr.cache_ttl = SESSION_CACHE_TTL_SECONDS
+            multi_account_mgr.global_session_cache.configure(
+                ttl_seconds=SESSION_CACHE_TTL_SECONDS
+            )
             for account_id, account_mgr in multi_account_mgr.accounts.items():
                 account_mgr.account_failure_threshold = ACCOUNT_FAILURE_THRESHOLD
                 account_mgr.rate_limit_cooldown_seconds = RATE_LIMIT_COOLDOWN_SECONDS
+            # 冷却时长变化后重新计算冷却结束时间
+            multi_account_mgr.scheduler.refresh_all()
 
         logger.info(f"[CONFIG] 系统设置已更新并实时生效")
         return {"status": "success", "message": "设置已保存并实时生效！"}
@@ -1814,14 +1736,12 @@ async def admin_get_logs(
 
     stats_by_level = {}
     error_logs = []
-    chat_count = 0
+    chat_count = len(request_events)
     for log in logs:
         level_name = log.get("level", "INFO")
         stats_by_level[level_name] = stats_by_level.get(level_name, 0) + 1
         if level_name in ["ERROR", "CRITICAL"]:
             error_logs.append(log)
-        if "收到请求" in log.get("message", ""):
-            chat_count += 1
 
     level_filter = (level or "").upper()
     search_filter = (search or "").lower()
@@ -1873,6 +1793,8 @@ async def admin_clear_logs(request: Request, confirm: Optional[str] = None):
     with log_lock:
         cleared_count = len(log_buffer)
         log_buffer.clear()
+    request_events.clear()
+    public_cache.clear()
     logger.info("[LOG] 日志已清空")
     return {
         "status": "success",
@@ -1960,6 +1882,7 @@ async def chat_impl(
     start_ts = time.time()
     request.state.first_response_time = None
     message_count = len(req.messages)
+    request_events.start(request_id, req.model, message_count)
 
     monitor_recorded = False
 
@@ -1983,6 +1906,9 @@ async def chat_impl(
         uptime_tracker.record_request(
             "api_service", status == "success", latency_ms, status_code
         )
+        request_events.complete(
+            request_id, status, duration_s if status == "success" else None
+        )
 
         entry = build_recent_conversation_entry(
             request_id=request_id,
@@ -1994,20 +1920,18 @@ async def chat_impl(
             error_detail=error_detail,
         )
 
-        async with stats_lock:
-            global_stats.setdefault("failure_timestamps", [])
-            global_stats.setdefault("rate_limit_timestamps", [])
-            global_stats.setdefault("recent_conversations", [])
-            if status != "success":
-                if status_code == 429:
-                    global_stats["rate_limit_timestamps"].append(time.time())
-                else:
-                    global_stats["failure_timestamps"].append(time.time())
-            global_stats["recent_conversations"].append(entry)
-            global_stats["recent_conversations"] = global_stats["recent_conversations"][
-                -60:
-            ]
-            await save_stats(global_stats)
+        # 只修改内存（无 await，不需要加锁），由 stats_persister 异步写回
+        global_stats.setdefault("recent_conversations", [])
+        if status != "success":
+            if status_code == 429:
+                global_stats["rate_limit_counts"].add()
+            else:
+                global_stats["failure_counts"].add()
+        global_stats["recent_conversations"].append(entry)
+        global_stats["recent_conversations"] = global_stats["recent_conversations"][
+            -60:
+        ]
+        stats_persister.mark_dirty()
 
     def classify_error_status(status_code: Optional[int], error: Exception) -> str:
         if status_code == 504:
@@ -2024,15 +1948,10 @@ async def chat_impl(
         client_ip = request.client.host if request.client else "unknown"
 
     # 记录请求统计
-    async with stats_lock:
-        timestamp = time.time()
-        global_stats["total_requests"] += 1
-        global_stats["request_timestamps"].append(timestamp)
-        global_stats.setdefault("model_request_timestamps", {})
-        global_stats["model_request_timestamps"].setdefault(req.model, []).append(
-            timestamp
-        )
-        await save_stats(global_stats)
+    timestamp = time.time()
+    global_stats["total_requests"] += 1
+    global_stats["request_counts"].add(timestamp)
+    stats_persister.mark_dirty()
 
     # 2. 模型校验
 
@@ -2045,21 +1964,33 @@ async def chat_impl(
             detail=f"Model '{req.model}' not found. Available models: {all_models}",
         )
 
+    # 按模型统计只记录已知模型（客户端传入的任意模型名不会生成新的计数环）
+    model_counter = global_stats["model_request_counts"].get(req.model)
+    if model_counter is None:
+        model_counter = global_stats["model_request_counts"][req.model] = (
+            TimeBucketCounter()
+        )
+    model_counter.add(timestamp)
+
     # 保存模型信息到 request.state（用于 Uptime 追踪）
     request.state.model = req.model
 
-    # 3. 生成会话指纹，获取Session锁（防止同一对话的并发请求冲突）
-    conv_key = get_conversation_key([m.model_dump() for m in req.messages], client_ip)
-    session_lock = await multi_account_mgr.acquire_session_lock(conv_key)
-
+    # 3. 生成对话历史的前缀指纹链，按最长的已记录历史前缀查找 Session
+    #    conv_key 为包含本次全部消息的指纹，本轮结束后 Session 以它（及 AI 回复）为 key
+    history_keys = get_history_keys(req.messages, client_ip)
+    conv_key = history_keys[-1] if history_keys else f"{client_ip}:empty"
+    session_cache = multi_account_mgr.global_session_cache
+    prefix_index = session_cache.find_longest_prefix(history_keys[:-1])
+    matched_key = history_keys[prefix_index] if prefix_index is not None else None
     account_manager: Optional[AccountManager] = None
     google_session: Optional[str] = None
     is_new_conversation = False
 
     # 4. 在锁的保护下检查缓存和处理Session（保证同一对话的请求串行化）
-    async with session_lock:
+    async with multi_account_mgr.session_lock(matched_key or conv_key):
+        # 等锁期间 Session 可能已被同一历史的其他请求接走（key 已更新）
         cached_session: Optional[Dict[str, Any]] = (
-            multi_account_mgr.global_session_cache.get(conv_key)
+            session_cache.peek(matched_key) if matched_key else None
         )
 
         if cached_session is not None:
@@ -2073,14 +2004,17 @@ async def chat_impl(
                 raise HTTPException(500, "Invalid cached session")
             google_session = google_session_any
             is_new_conversation = False
+            # Session 的已发送历史推进到本次请求
+            session_cache.rekey(matched_key, conv_key)
             logger.info(
-                f"[CHAT] [{account_id}] [req_{request_id}] 继续会话: {google_session[-12:]}"
+                f"[CHAT] [{account_id}] [req_{request_id}] 继续会话: {google_session[-12:]} (历史前缀 {prefix_index + 1}/{len(req.messages)} 条)"
             )
         else:
             # 新对话：轮询选择可用账户，失败时尝试其他账户
             if req.stream:
                 # 流式请求：延后 Session 创建到 response_wrapper()，确保尽快返回 StreamingResponse，避免客户端 60s 超时
                 account_manager = await multi_account_mgr.get_account(None, request_id)
+                request_events.select_account(request_id)
                 is_new_conversation = True
                 logger.info(
                     f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 新对话已选定账户，延后创建Session"
@@ -2096,8 +2030,9 @@ async def chat_impl(
                         account_manager = await multi_account_mgr.get_account(
                             None, request_id
                         )
-                        google_session = await create_google_session(
-                            account_manager, http_client, USER_AGENT, request_id
+                        request_events.select_account(request_id)
+                        google_session = await acquire_google_session(
+                            account_manager, request_id
                         )
                         # 线程安全地绑定账户到此对话
                         await multi_account_mgr.set_session_cache(
@@ -2122,6 +2057,7 @@ async def chat_impl(
                         logger.error(
                             f"[CHAT] [req_{request_id}] 账户 {account_id} 创建会话失败 (尝试 {attempt + 1}/{max_account_tries}) - {error_type}: {str(e)}"
                         )
+                        request_events.retry(request_id)
                         # 记录账号池状态（单个账户失败）
                         status_code = (
                             e.status_code if isinstance(e, HTTPException) else None
@@ -2179,7 +2115,11 @@ async def chat_impl(
     # 3. 解析请求内容
     try:
         last_text, current_images = await parse_last_message(
-            req.messages, http_client, request_id
+            req.messages,
+            http_client,
+            request_id,
+            max_download_bytes=config_manager.url_download_max_mb * 1024 * 1024,
+            download_cache=url_download_cache,
         )
     except HTTPException as e:
         status = classify_error_status(e.status_code, e)
@@ -2198,8 +2138,19 @@ async def chat_impl(
         text_to_send = last_text
         is_retry_mode = True
     else:
-        # 继续对话只发送当前消息
-        text_to_send = last_text
+        # 继续对话：只发送 Session 尚未见过的消息
+        # 命中前缀之后紧跟的 assistant 消息是该 Session 自己的回复（带媒体的回复按用户消息记录指纹），无需重发
+        unsent_messages = req.messages[prefix_index + 1:]
+        if len(unsent_messages) > 1 and unsent_messages[0].role == "assistant":
+            unsent_messages = unsent_messages[1:]
+        if len(unsent_messages) > 1:
+            # 中间还有未发送的消息（如工具结果、追加的系统提示），按上下文格式一并发送
+            text_to_send = build_full_context_text(unsent_messages)
+            logger.info(
+                f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 补发未同步的 {len(unsent_messages)} 条消息"
+            )
+        else:
+            text_to_send = last_text
         is_retry_mode = False
         # 线程安全地更新时间戳
         await multi_account_mgr.update_session_time(conv_key)
@@ -2228,12 +2179,17 @@ async def chat_impl(
 
         # 记录已失败的账户，避免重复使用
         failed_accounts = set()
+        # 已切换账户的次数（上限 MAX_ACCOUNT_SWITCH_TRIES）
+        account_switches = 0
 
         # 重试逻辑：最多尝试 max_retries+1 次（初次+重试）
         while retry_count <= max_retries:
+            # 本次尝试占用的账户（用于进行中请求数统计）
+            attempt_account = account_manager
+            attempt_account.begin_request()
             try:
                 # 安全：使用.get()防止缓存被清理导致KeyError
-                cached = multi_account_mgr.global_session_cache.get(conv_key)
+                cached = multi_account_mgr.global_session_cache.peek(conv_key)
                 if not cached:
                     logger.warning(
                         f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 缓存已清理，重建Session"
@@ -2241,21 +2197,19 @@ async def chat_impl(
 
                     if req.stream:
                         create_task = asyncio.create_task(
-                            create_google_session(
-                                account_manager, http_client, USER_AGENT, request_id
-                            )
+                            acquire_google_session(account_manager, request_id)
                         )
                         while True:
                             try:
                                 new_sess = await asyncio.wait_for(
-                                    create_task, timeout=15
+                                    asyncio.shield(create_task), timeout=15
                                 )
                                 break
                             except asyncio.TimeoutError:
                                 yield ": keep-alive\n\n"
                     else:
-                        new_sess = await create_google_session(
-                            account_manager, http_client, USER_AGENT, request_id
+                        new_sess = await acquire_google_session(
+                            account_manager, request_id
                         )
 
                     await multi_account_mgr.set_session_cache(
@@ -2270,39 +2224,25 @@ async def chat_impl(
                 # A. 如果有图片且还没上传到当前 Session，先上传
                 # 注意：每次重试如果是新 Session，都需要重新上传图片
                 if current_images and not current_file_ids:
-                    for img in current_images:
-                        if req.stream:
-                            upload_task = asyncio.create_task(
-                                upload_context_file(
-                                    current_session,
-                                    img["mime"],
-                                    img["data"],
-                                    account_manager,
-                                    http_client,
-                                    USER_AGENT,
-                                    request_id,
-                                )
-                            )
-                            while True:
-                                try:
-                                    fid = await asyncio.wait_for(
-                                        upload_task, timeout=15
-                                    )
-                                    break
-                                except asyncio.TimeoutError:
-                                    yield ": keep-alive\n\n"
-                        else:
-                            fid = await upload_context_file(
-                                current_session,
-                                img["mime"],
-                                img["data"],
-                                account_manager,
-                                http_client,
-                                USER_AGENT,
-                                request_id,
+                    if req.stream:
+                        # 整批上传共用一个保活循环（shield 避免超时取消上传任务）
+                        upload_task = asyncio.create_task(
+                            upload_attachments(
+                                current_session, current_images, account_manager, request_id
                             )
-
-                        current_file_ids.append(fid)
+                        )
+                        while True:
+                            try:
+                                current_file_ids = await asyncio.wait_for(
+                                    asyncio.shield(upload_task), timeout=15
+                                )
+                                break
+                            except asyncio.TimeoutError:
+                                yield ": keep-alive\n\n"
+                    else:
+                        current_file_ids = await upload_attachments(
+                            current_session, current_images, account_manager, request_id
+                        )
 
                 # B. 准备文本 (重试模式下发全文)
                 if current_retry_mode and len(req.messages) > 1:
@@ -2311,6 +2251,7 @@ async def chat_impl(
                     current_text = build_full_context_text(req.messages)
 
                 # C. 发起对话
+                reply: Dict[str, str] = {}
                 async for chunk in stream_chat_generator(
                     current_session,
                     current_text,
@@ -2322,9 +2263,16 @@ async def chat_impl(
                     req.stream,
                     request_id,
                     request,
+                    reply,
                 ):
                     yield chunk
 
+                # Session 的历史推进到本轮 AI 回复，下一轮请求（带上这条回复）按前缀命中
+                if reply.get("content"):
+                    multi_account_mgr.global_session_cache.rekey(
+                        conv_key, extend_history_key(conv_key, "assistant", reply["content"])
+                    )
+
                 # 请求成功，重置账户失败计数
                 account_manager.is_available = True
                 account_manager.error_count = 0
@@ -2334,13 +2282,12 @@ async def chat_impl(
                 uptime_tracker.record_request("account_pool", True)
 
                 # 保存对话次数到统计数据
-                async with stats_lock:
-                    if "account_conversations" not in global_stats:
-                        global_stats["account_conversations"] = {}
-                    global_stats["account_conversations"][
-                        account_manager.config.account_id
-                    ] = account_manager.conversation_count
-                    await save_stats(global_stats)
+                if "account_conversations" not in global_stats:
+                    global_stats["account_conversations"] = {}
+                global_stats["account_conversations"][
+                    account_manager.config.account_id
+                ] = account_manager.conversation_count
+                stats_persister.mark_dirty()
 
                 await finalize_result("success", 200, None)
 
@@ -2395,15 +2342,8 @@ async def chat_impl(
                     )
 
                     # 快速失败：检查是否还有可用账户（避免无效重试）
-                    available_count = sum(
-                        1
-                        for acc in multi_account_mgr.accounts.values()
-                        if (
-                            acc.should_retry()
-                            and not acc.config.is_expired()
-                            and not acc.config.disabled
-                            and acc.config.account_id not in failed_accounts
-                        )
+                    available_count = multi_account_mgr.available_count(
+                        exclude=failed_accounts
                     )
 
                     if available_count == 0:
@@ -2415,21 +2355,23 @@ async def chat_impl(
                             yield f"data: {json.dumps({'error': {'message': 'All accounts unavailable'}})}\n\n"
                         return
 
+                    if account_switches >= MAX_ACCOUNT_SWITCH_TRIES:
+                        logger.error(
+                            f"[CHAT] [req_{request_id}] 已达到账户切换上限 ({MAX_ACCOUNT_SWITCH_TRIES})，请求失败"
+                        )
+                        await finalize_result(
+                            "error", 503, "Account switch limit reached"
+                        )
+                        if req.stream:
+                            yield f"data: {json.dumps({'error': {'message': 'Account switch limit reached'}})}\n\n"
+                        return
+
                     # 尝试切换到其他账户（客户端会传递完整上下文）
                     try:
                         # 获取新账户，跳过已失败的账户
-                        max_account_tries = min(
-                            MAX_ACCOUNT_SWITCH_TRIES, available_count
-                        )  # 限制尝试次数
-                        new_account = None
-
-                        for _ in range(max_account_tries):
-                            candidate = await multi_account_mgr.get_account(
-                                None, request_id
-                            )
-                            if candidate.config.account_id not in failed_accounts:
-                                new_account = candidate
-                                break
+                        new_account = multi_account_mgr.pick_account(
+                            request_id, exclude=failed_accounts
+                        )
 
                         if not new_account:
                             logger.error(
@@ -2442,13 +2384,15 @@ async def chat_impl(
                                 yield f"data: {json.dumps({'error': {'message': 'All available accounts failed'}})}\n\n"
                             return
 
+                        account_switches += 1
                         logger.info(
                             f"[CHAT] [req_{request_id}] 切换账户: {account_manager.config.account_id} -> {new_account.config.account_id}"
                         )
+                        request_events.switch_account(request_id)
 
                         # 创建新 Session
-                        new_sess = await create_google_session(
-                            new_account, http_client, USER_AGENT, request_id
+                        new_sess = await acquire_google_session(
+                            new_account, request_id
                         )
 
                         # 更新缓存绑定到新账户
@@ -2499,6 +2443,8 @@ async def chat_impl(
                     if req.stream:
                         yield f"data: {json.dumps({'error': {'message': f'Max retries ({max_retries}) exceeded: {e}'}})}\n\n"
                     return
+            finally:
+                attempt_account.end_request()
 
     if req.stream:
         return StreamingResponse(
@@ -2512,27 +2458,16 @@ async def chat_impl(
             },
         )
 
-    full_content = ""
-    full_reasoning = ""
-    async for chunk_str in response_wrapper():
-        if chunk_str.startswith("data: [DONE]"):
-            break
-        if chunk_str.startswith("data: "):
-            try:
-                data = json.loads(chunk_str[6:])
-                delta = data["choices"][0]["delta"]
-                if "content" in delta:
-                    full_content += delta["content"]
-                if "reasoning_content" in delta:
-                    full_reasoning += delta["reasoning_content"]
-            except json.JSONDecodeError as e:
-                logger.error(
-                    f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}"
-                )
-            except (KeyError, IndexError) as e:
-                logger.error(
-                    f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 响应格式错误 ({type(e).__name__}): {str(e)}"
-                )
+    # 非流式：直接收集结构化增量，最后一次性拼接
+    content_parts: List[str] = []
+    reasoning_parts: List[str] = []
+    async for kind, text in response_wrapper():
+        if kind == "reasoning":
+            reasoning_parts.append(text)
+        else:
+            content_parts.append(text)
+    full_content = "".join(content_parts)
+    full_reasoning = "".join(reasoning_parts)
 
     # 构建响应消息
     message = {"role": "assistant", "content": full_content}
@@ -2563,23 +2498,27 @@ async def chat_impl(
 
 
 # ---------- 图片生成处理函数 ----------
-def parse_images_from_response(data_list: list) -> tuple[list, str]:
-    """从API响应中解析图片文件引用
-    返回: (file_ids_list, session_name)
-    file_ids_list: [{"fileId": str, "mimeType": str}, ...]
+class StreamFileCollector:
+    """逐个事件提取生成文件引用和 sessionInfo，不保留原始事件
+    file_ids: [{"fileId": str, "mimeType": str}, ...]
+    session_name: 最新事件中的 session
     """
-    file_ids = []
-    session_name = ""
 
-    for data in data_list:
+    __slots__ = ("file_ids", "session_name")
+
+    def __init__(self) -> None:
+        self.file_ids: list = []
+        self.session_name = ""
+
+    def add(self, data: dict) -> None:
         sar = data.get("streamAssistResponse")
         if not sar:
-            continue
+            return
 
         # 获取session信息（优先使用最新的）
         session_info = sar.get("sessionInfo", {})
         if session_info.get("session"):
-            session_name = session_info["session"]
+            self.session_name = session_info["session"]
 
         answer = sar.get("answer") or {}
         replies = answer.get("replies") or []
@@ -2602,14 +2541,38 @@ def parse_images_from_response(data_list: list) -> tuple[list, str]:
                 mime = "image/png"
 
             logger.debug(f"[PARSE] 解析文件: fileId={fid}, mimeType={mime}")
-            file_ids.append(
+            self.file_ids.append(
                 {
                     "fileId": fid,
                     "mimeType": mime,
                 }
             )
 
-    return file_ids, session_name
+
+def summarize_stream_event(obj: object) -> dict:
+    """上游事件的结构摘要（不包含文本内容），用于排查空响应"""
+    try:
+        if not isinstance(obj, dict):
+            return {"type": type(obj).__name__}
+        sar = obj.get("streamAssistResponse")
+        summary: dict = {
+            "keys": sorted(list(obj.keys()))[:20],
+            "has_streamAssistResponse": isinstance(sar, dict),
+        }
+        if isinstance(sar, dict):
+            answer = sar.get("answer")
+            replies = (
+                (answer or {}).get("replies") if isinstance(answer, dict) else None
+            )
+            summary.update(
+                {
+                    "sar_keys": sorted(list(sar.keys()))[:20],
+                    "reply_count": len(replies) if isinstance(replies, list) else None,
+                }
+            )
+        return summary
+    except Exception as e:
+        return {"summary_error": type(e).__name__}
 
 
 async def stream_chat_generator(
@@ -2623,9 +2586,11 @@ async def stream_chat_generator(
     is_stream: bool = True,
     request_id: str = "",
     request: Optional[Request] = None,
+    reply_sink: Optional[Dict[str, str]] = None,
 ):
+    """reply_sink 不为 None 时，响应完整结束后写入 AI 回复文本（仅纯文本回复，用于推进会话历史指纹）"""
     start_time = time.time()
-    full_content = ""
+    content_parts: List[str] = []
     first_response_time = None
     saw_text = False
 
@@ -2641,12 +2606,21 @@ async def stream_chat_generator(
             f"[API] [{account_manager.config.account_id}] [req_{request_id}] 附带文件: {len(file_ids)}个"
         )
 
+    # 流式：产出编码好的 SSE 帧；非流式：产出 (kind, text) 结构化增量，由调用方直接聚合
+    # 同一响应内 id/created/model 不变，预编码后每个 token 只转义 delta 文本
+    encoder = ChunkEncoder(chat_id, created_time, model_name)
+    # 快速上游会产生大量细碎增量，按窗口合并后再写出
+    coalescer = DeltaCoalescer(
+        encoder, config_manager.stream_flush_window_ms, config_manager.stream_flush_bytes
+    )
+
+    def delta(text: str):
+        """不经过合并的单条正文增量（提示、图片等低频输出）"""
+        return encoder.content(text) if is_stream else ("content", text)
+
     # 先发一个 role chunk，避免客户端/代理的 first-byte 超时
     if is_stream:
-        chunk = create_chunk(
-            chat_id, created_time, model_name, {"role": "assistant"}, None
-        )
-        yield f"data: {chunk}\n\n"
+        yield encoder.encode({"role": "assistant"})
 
     jwt = await account_manager.get_jwt(request_id)
     headers = get_common_headers(jwt, USER_AGENT)
@@ -2676,12 +2650,15 @@ async def stream_chat_generator(
         }
 
     # 使用流式请求
-    json_objects = []  # 收集所有响应对象用于图片解析
+    # 不保留原始事件：文件引用/sessionInfo 逐个提取，空响应排查只保留最近几条事件的结构摘要
+    file_collector = StreamFileCollector()
+    event_count = 0
+    event_summaries: deque = deque(maxlen=10)
     file_ids_info = None  # 保存图片信息
 
     async with http_client.stream(
         "POST",
-        "https://biz-discoveryengine.googleapis.com/v1alpha/locations/global/widgetStreamAssist",
+        f"{GEMINI_API_BASE}/locations/global/widgetStreamAssist",
         headers=headers,
         json=body,
     ) as r:
@@ -2696,44 +2673,35 @@ async def stream_chat_generator(
         # 使用异步解析器处理 JSON 数组流。
         # 注意：部分客户端（例如 CherryStudio）可能存在 60s 的 idle timeout。
         # 这里通过 SSE keep-alive 注释行，确保长连接在无 token 输出时也能持续收到字节流。
+        json_stream: Optional[KeepAliveStream] = None
         try:
             keepalive_interval_s = 15
-            queue: asyncio.Queue[tuple[str, object | None]] = asyncio.Queue()
 
-            async def _reader():
-                try:
-                    async for json_obj in parse_json_array_stream_async(
-                        r.aiter_lines()
-                    ):
-                        await queue.put(("json", json_obj))
-                except Exception as exc:
-                    await queue.put(("error", exc))
-                finally:
-                    await queue.put(("done", None))
-
-            reader_task = asyncio.create_task(_reader())
-
-            while True:
-                try:
-                    kind, payload = await asyncio.wait_for(
-                        queue.get(), timeout=keepalive_interval_s
-                    )
-                except asyncio.TimeoutError:
-                    if is_stream:
-                        yield ": keep-alive\n\n"
-                    continue
+            # 默认按字节块批量解析；可在设置中关闭以回退到逐行逐字符解析。
+            # 在当前协程中直接拉取并解析，客户端读得慢时上游读取也随之暂停。
+            if config_manager.fast_stream_parser:
+                decoder = JsonArrayStreamDecoder()
+                json_stream = KeepAliveStream(
+                    r.aiter_bytes(), keepalive_interval_s, decoder.feed, decoder.close
+                )
+            else:
+                json_stream = KeepAliveStream(
+                    parse_json_array_stream_async(r.aiter_lines()), keepalive_interval_s
+                )
 
-                if kind == "done":
-                    break
-                if kind == "error":
-                    assert isinstance(payload, Exception)
-                    raise payload
-                if kind != "json":
+            async for json_obj in json_stream:
+                if json_obj is None:
+                    # 保活截止或合并窗口到期：有待发送的增量就刷新，否则发 keep-alive
+                    if coalescer.deadline is not None:
+                        yield coalescer.flush()
+                    elif is_stream:
+                        yield ": keep-alive\n\n"
                     continue
 
-                assert isinstance(payload, dict)
-                json_obj = payload
-                json_objects.append(json_obj)  # 收集响应
+                event_count += 1
+                file_collector.add(json_obj)
+                if not saw_text and not file_collector.file_ids:
+                    event_summaries.append(summarize_stream_event(json_obj))
 
                 # 提取文本内容
                 for reply in (
@@ -2750,32 +2718,33 @@ async def stream_chat_generator(
                     # 区分思考过程和正常内容
                     if content_obj.get("thought"):
                         # 思考过程使用 reasoning_content 字段（类似 OpenAI o1）
-                        chunk = create_chunk(
-                            chat_id,
-                            created_time,
-                            model_name,
-                            {"reasoning_content": text},
-                            None,
-                        )
-                        yield f"data: {chunk}\n\n"
+                        if not is_stream:
+                            yield ("reasoning", text)
+                            continue
+                        frame = coalescer.push("reasoning", text, time.monotonic())
+                        json_stream.wake_at = coalescer.deadline
+                        if frame:
+                            yield frame
                     else:
                         if first_response_time is None:
                             first_response_time = time.time()
                             if request is not None:
                                 request.state.first_response_time = first_response_time
                         # 正常内容使用 content 字段
-                        full_content += text
+                        content_parts.append(text)
                         saw_text = True
-                        chunk = create_chunk(
-                            chat_id, created_time, model_name, {"content": text}, None
-                        )
-                        yield f"data: {chunk}\n\n"
-
-            await reader_task
+                        if not is_stream:
+                            yield ("content", text)
+                            continue
+                        frame = coalescer.push("content", text, time.monotonic())
+                        json_stream.wake_at = coalescer.deadline
+                        if frame:
+                            yield frame
 
             # 提取图片信息（在 async with 块内）
-            if json_objects:
-                file_ids, session_name = parse_images_from_response(json_objects)
+            if event_count:
+                file_ids = file_collector.file_ids
+                session_name = file_collector.session_name
                 if file_ids and session_name:
                     file_ids_info = (file_ids, session_name)
                     logger.info(
@@ -2792,10 +2761,11 @@ async def stream_chat_generator(
                 model_name, False, status_code=499
             )  # 499: Client Closed Request (nginx)
             raise
-        except ValueError as e:
+        except (ValueError, RecursionError) as e:
+            # 解析器的错误类型：格式错误为 ValueError（含 json.JSONDecodeError），嵌套过深为 RecursionError
             uptime_tracker.record_request(model_name, False)
             logger.error(
-                f"[API] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}"
+                f"[API] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败 ({type(e).__name__}): {str(e)}"
             )
         except Exception as e:
             error_type = type(e).__name__
@@ -2804,6 +2774,16 @@ async def stream_chat_generator(
                 f"[API] [{account_manager.config.account_id}] [req_{request_id}] 流处理错误 ({error_type}): {str(e)}"
             )
             raise
+        finally:
+            if json_stream is not None:
+                await json_stream.aclose()
+
+    # 发送合并窗口中剩余的增量（JSON 解析失败时也保留已收到的内容；其他错误已向上抛出）
+    tail = coalescer.flush()
+    if tail:
+        yield tail
+    stream_stats["deltas"] += coalescer.deltas
+    stream_stats["frames"] += coalescer.frames
 
     # 在 async with 块外处理图片下载（避免占用上游连接）
     if not saw_text and not file_ids_info:
@@ -2811,40 +2791,9 @@ async def stream_chat_generator(
         # 这会导致客户端看到“空响应”。这里同时：
         # 1) 记录结构化摘要（不包含文本内容）便于排查
         # 2) 给客户端回一个可见的提示，避免误以为服务端无响应
-        try:
-            event_summaries: list[dict] = []
-            for obj in json_objects[:10]:
-                if not isinstance(obj, dict):
-                    continue
-                sar = obj.get("streamAssistResponse")
-                summary: dict = {
-                    "keys": sorted(list(obj.keys()))[:20],
-                    "has_streamAssistResponse": isinstance(sar, dict),
-                }
-                if isinstance(sar, dict):
-                    answer = sar.get("answer")
-                    replies = (
-                        (answer or {}).get("replies")
-                        if isinstance(answer, dict)
-                        else None
-                    )
-                    summary.update(
-                        {
-                            "sar_keys": sorted(list(sar.keys()))[:20],
-                            "reply_count": len(replies)
-                            if isinstance(replies, list)
-                            else None,
-                        }
-                    )
-                event_summaries.append(summary)
-
-            logger.warning(
-                f"[API] [{account_manager.config.account_id}] [req_{request_id}] 上游未返回文本/图片 (events={len(json_objects)}) summaries={event_summaries}"
-            )
-        except Exception as e:
-            logger.warning(
-                f"[API] [{account_manager.config.account_id}] [req_{request_id}] 上游未返回文本/图片 (events={len(json_objects)}); summary failed: {type(e).__name__}"
-            )
+        logger.warning(
+            f"[API] [{account_manager.config.account_id}] [req_{request_id}] 上游未返回文本/图片 (events={event_count}) summaries={list(event_summaries)}"
+        )
 
         if is_stream:
             tip = (
@@ -2852,10 +2801,7 @@ async def stream_chat_generator(
                 "可能原因：该模型/接口未触发图片生成，或上游本次返回了空事件流。\n"
                 "建议：1) 换模型试试 gemini-2.5-pro 2) 允许输出少量文字说明 3) 稍后重试。\n\n"
             )
-            chunk = create_chunk(
-                chat_id, created_time, model_name, {"content": tip}, None
-            )
-            yield f"data: {chunk}\n\n"
+            yield delta(tip)
 
     if file_ids_info:
         file_ids, session_name = file_ids_info
@@ -2905,10 +2851,7 @@ async def stream_chat_generator(
                     )
                     # 降级处理：返回错误提示而不是静默失败
                     error_msg = f"\n\n⚠️ 图片 {idx} 下载失败\n\n"
-                    chunk = create_chunk(
-                        chat_id, created_time, model_name, {"content": error_msg}, None
-                    )
-                    yield f"data: {chunk}\n\n"
+                    yield delta(error_msg)
                     continue
 
                 try:
@@ -2932,19 +2875,13 @@ async def stream_chat_generator(
                         account_manager.config.account_id,
                     )
                     success_count += 1
-                    chunk = create_chunk(
-                        chat_id, created_time, model_name, {"content": markdown}, None
-                    )
-                    yield f"data: {chunk}\n\n"
+                    yield delta(markdown)
                 except Exception as save_error:
                     logger.error(
                         f"[MEDIA] [{account_manager.config.account_id}] [req_{request_id}] 媒体{idx}处理失败: {str(save_error)[:100]}"
                     )
                     error_msg = f"\n\n⚠️ 媒体 {idx} 处理失败\n\n"
-                    chunk = create_chunk(
-                        chat_id, created_time, model_name, {"content": error_msg}, None
-                    )
-                    yield f"data: {chunk}\n\n"
+                    yield delta(error_msg)
 
             logger.info(
                 f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理完成: {success_count}/{len(file_ids)} 成功"
@@ -2956,11 +2893,9 @@ async def stream_chat_generator(
             )
             # 降级处理：通知用户图片处理失败
             error_msg = f"\n\n⚠️ 图片处理失败: {type(e).__name__}\n\n"
-            chunk = create_chunk(
-                chat_id, created_time, model_name, {"content": error_msg}, None
-            )
-            yield f"data: {chunk}\n\n"
+            yield delta(error_msg)
 
+    full_content = "".join(content_parts)
     if full_content:
         response_preview = (
             full_content[:500] + "...(已截断)"
@@ -2978,13 +2913,19 @@ async def stream_chat_generator(
         uptime_tracker.record_request(model_name, True)
 
     total_time = time.time() - start_time
+    account_manager.record_latency(
+        first_response_time - start_time if first_response_time else None, total_time
+    )
     logger.info(
         f"[API] [{account_manager.config.account_id}] [req_{request_id}] 响应完成: {total_time:.2f}秒"
     )
 
+    # 回复中带有图片/媒体时，客户端回传的内容与 full_content 不一致，保留本轮用户消息的指纹
+    if reply_sink is not None and saw_text and not file_ids_info:
+        reply_sink["content"] = full_content
+
     if is_stream:
-        final_chunk = create_chunk(chat_id, created_time, model_name, {}, "stop")
-        yield f"data: {final_chunk}\n\n"
+        yield encoder.encode({}, "stop")
         yield "data: [DONE]\n\n"
 
 
@@ -2997,38 +2938,34 @@ async def get_public_uptime(days: int = 90):
     return await uptime_tracker.get_uptime_summary(days)
 
 
-@app.get("/public/stats")
-async def get_public_stats():
-    """获取公开统计信息"""
-    async with stats_lock:
-        # 清理1小时前的请求时间戳
-        current_time = time.time()
-        recent_requests = [
-            ts for ts in global_stats["request_timestamps"] if current_time - ts < 3600
-        ]
+def _build_public_stats() -> dict:
+    # 最近 60 秒的请求数（分钟桶滑动估算）
+    requests_per_minute = global_stats["request_counts"].last_minute()
 
-        # 计算每分钟请求数
-        recent_minute = [ts for ts in recent_requests if current_time - ts < 60]
-        requests_per_minute = len(recent_minute)
-
-        # 计算负载状态
-        if requests_per_minute < 10:
-            load_status = "low"
-            load_color = "#10b981"  # 绿色
-        elif requests_per_minute < 30:
-            load_status = "medium"
-            load_color = "#f59e0b"  # 黄色
-        else:
-            load_status = "high"
-            load_color = "#ef4444"  # 红色
+    # 计算负载状态
+    if requests_per_minute < 10:
+        load_status = "low"
+        load_color = "#10b981"  # 绿色
+    elif requests_per_minute < 30:
+        load_status = "medium"
+        load_color = "#f59e0b"  # 黄色
+    else:
+        load_status = "high"
+        load_color = "#ef4444"  # 红色
+
+    return {
+        "total_visitors": global_stats["total_visitors"],
+        "total_requests": global_stats["total_requests"],
+        "requests_per_minute": requests_per_minute,
+        "load_status": load_status,
+        "load_color": load_color,
+    }
 
-        return {
-            "total_visitors": global_stats["total_visitors"],
-            "total_requests": global_stats["total_requests"],
-            "requests_per_minute": requests_per_minute,
-            "load_status": load_status,
-            "load_color": load_color,
-        }
+
+@app.get("/public/stats")
+async def get_public_stats(request: Request):
+    """获取公开统计信息"""
+    return public_cache.respond(request, "stats", _build_public_stats)
 
 
 @app.get("/public/display")
@@ -3037,64 +2974,53 @@ async def get_public_display():
     return {"logo_url": LOGO_URL, "chat_url": CHAT_URL}
 
 
-@app.get("/public/log")
-async def get_public_logs(request: Request, limit: int = 100):
-    try:
-        # 基于IP的访问统计（24小时内去重）
-        client_ip = request.client.host if request.client else "unknown"
-        current_time = time.time()
-
-        async with stats_lock:
-            # 清理24小时前的IP记录
-            if "visitor_ips" not in global_stats:
-                global_stats["visitor_ips"] = {}
-            global_stats["visitor_ips"] = {
-                ip: timestamp
-                for ip, timestamp in global_stats["visitor_ips"].items()
-                if current_time - timestamp <= 86400
-            }
+def _record_public_visit(request: Request) -> None:
+    """基于IP的访问统计（24小时内同一IP只计数一次）"""
+    client_ip = request.client.host if request.client else "unknown"
+    if global_stats["visitor_ips"].visit(client_ip):
+        global_stats["total_visitors"] = global_stats.get("total_visitors", 0) + 1
+        stats_persister.mark_dirty()
 
-            # 记录新访问（24小时内同一IP只计数一次）
-            if client_ip not in global_stats["visitor_ips"]:
-                global_stats["visitor_ips"][client_ip] = current_time
-                global_stats["total_visitors"] = (
-                    global_stats.get("total_visitors", 0) + 1
-                )
 
-            global_stats.setdefault("recent_conversations", [])
-            await save_stats(global_stats)
+def _build_public_logs(limit: int) -> dict:
+    sanitized_logs = request_events.recent(limit=limit)
+    stored_logs = global_stats.get("recent_conversations", [])
 
-            stored_logs = list(global_stats.get("recent_conversations", []))
+    log_map = {log.get("request_id"): log for log in sanitized_logs}
+    for log in stored_logs:
+        request_id = log.get("request_id")
+        if request_id and request_id not in log_map:
+            log_map[request_id] = log
 
-        sanitized_logs = get_sanitized_logs(limit=min(limit, 1000))
+    def get_log_ts(item: dict) -> float:
+        if "start_ts" in item:
+            return float(item["start_ts"])
+        try:
+            return datetime.strptime(
+                item.get("start_time", ""), "%Y-%m-%d %H:%M:%S"
+            ).timestamp()
+        except Exception:
+            return 0.0
 
-        log_map = {log.get("request_id"): log for log in sanitized_logs}
-        for log in stored_logs:
-            request_id = log.get("request_id")
-            if request_id and request_id not in log_map:
-                log_map[request_id] = log
+    merged_logs = sorted(log_map.values(), key=get_log_ts, reverse=True)[:limit]
+    output_logs = []
+    for log in merged_logs:
+        if "start_ts" in log:
+            log = dict(log)
+            log.pop("start_ts", None)
+        output_logs.append(log)
 
-        def get_log_ts(item: dict) -> float:
-            if "start_ts" in item:
-                return float(item["start_ts"])
-            try:
-                return datetime.strptime(
-                    item.get("start_time", ""), "%Y-%m-%d %H:%M:%S"
-                ).timestamp()
-            except Exception:
-                return 0.0
-
-        merged_logs = sorted(log_map.values(), key=get_log_ts, reverse=True)[
-            : min(limit, 1000)
-        ]
-        output_logs = []
-        for log in merged_logs:
-            if "start_ts" in log:
-                log = dict(log)
-                log.pop("start_ts", None)
-            output_logs.append(log)
-
-        return {"total": len(output_logs), "logs": output_logs}
+    return {"total": len(output_logs), "logs": output_logs}
+
+
+@app.get("/public/log")
+async def get_public_logs(request: Request, limit: int = 100):
+    try:
+        _record_public_visit(request)
+        limit = max(1, min(limit, 1000))
+        return public_cache.respond(
+            request, f"log:{limit}", lambda: _build_public_logs(limit)
+        )
     except Exception as e:
         logger.error(f"[LOG] 获取公开日志失败: {e}")
         return {"total": 0, "logs": [], "error": str(e)}
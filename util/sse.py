@@ -0,0 +1,150 @@
+"""OpenAI 兼容的 SSE 数据块编码
+
+流式响应中每个 token 都会经过这里，保持无状态、无依赖，便于单独压测。
+"""
+import json
+from json.encoder import encode_basestring_ascii
+from typing import Union
+
+# 文本 delta 之后的固定部分：闭合 delta 对象 + 未结束的 finish_reason
+_TEXT_DELTA_TAIL = '}, "logprobs": null, "finish_reason": null}], "system_fingerprint": null}\n\n'
+
+
+def create_chunk(
+    id: str, created: int, model: str, delta: dict, finish_reason: Union[str, None]
+) -> str:
+    chunk = {
+        "id": id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "logprobs": None,  # OpenAI 标准字段
+                "finish_reason": finish_reason,
+            }
+        ],
+        "system_fingerprint": None,  # OpenAI 标准字段（可选）
+    }
+    return json.dumps(chunk)
+
+
+class ChunkEncoder:
+    """单个响应的 SSE 数据块编码器
+
+    id / created / model 在一次响应内不变，构造时预先编码为前缀和后缀，
+    每个 token 只需转义 delta 文本再拼接。所有 delta 的输出都与
+    ``f"data: {create_chunk(...)}\\n\\n"`` 逐字节一致。
+    """
+
+    __slots__ = ("_prefix", "_suffix", "_content_prefix", "_reasoning_prefix")
+
+    def __init__(self, id: str, created: int, model: str) -> None:
+        head = json.dumps(
+            {"id": id, "object": "chat.completion.chunk", "created": created, "model": model}
+        )
+        self._prefix = 'data: ' + head[:-1] + ', "choices": [{"index": 0, "delta": '
+        self._suffix = ', "logprobs": null, "finish_reason": '
+        self._content_prefix = self._prefix + '{"content": '
+        self._reasoning_prefix = self._prefix + '{"reasoning_content": '
+
+    def _tail(self, finish_reason: Union[str, None]) -> str:
+        reason = "null" if finish_reason is None else encode_basestring_ascii(finish_reason)
+        return self._suffix + reason + '}], "system_fingerprint": null}\n\n'
+
+    def content(self, text: str) -> str:
+        """正文增量：{"content": text}"""
+        return (
+            self._content_prefix
+            + encode_basestring_ascii(text)
+            + _TEXT_DELTA_TAIL
+        )
+
+    def reasoning(self, text: str) -> str:
+        """思考过程增量：{"reasoning_content": text}"""
+        return (
+            self._reasoning_prefix
+            + encode_basestring_ascii(text)
+            + _TEXT_DELTA_TAIL
+        )
+
+    def encode(self, delta: dict, finish_reason: Union[str, None] = None) -> str:
+        """任意 delta（role chunk、结束 chunk 等低频场景）"""
+        if len(delta) == 1:
+            text = delta.get("content")
+            if isinstance(text, str) and finish_reason is None:
+                return self.content(text)
+            text = delta.get("reasoning_content")
+            if isinstance(text, str) and finish_reason is None:
+                return self.reasoning(text)
+        return self._prefix + json.dumps(delta) + self._tail(finish_reason)
+
+
+class DeltaCoalescer:
+    """合并连续的同类文本增量，减少小 SSE 帧的写入次数
+
+    - 每种增量（正文 / 思考）的第一条立即输出，首包延迟不受影响
+    - 之后的增量在窗口期内累积，达到字节上限、窗口到期或类型切换时合并为一帧
+    - window_ms 为 0 时退化为逐条输出
+    """
+
+    __slots__ = (
+        "_encoder", "_window", "_max_bytes", "_kind", "_parts", "_size",
+        "_deadline", "_started", "deltas", "frames",
+    )
+
+    def __init__(self, encoder: ChunkEncoder, window_ms: int, max_bytes: int) -> None:
+        self._encoder = encoder
+        self._window = max(0, window_ms) / 1000
+        self._max_bytes = max_bytes
+        self._kind: Union[str, None] = None
+        self._parts: list = []
+        self._size = 0
+        self._deadline: Union[float, None] = None
+        self._started: set = set()
+        self.deltas = 0
+        self.frames = 0
+
+    @property
+    def deadline(self) -> Union[float, None]:
+        """有待发送内容时的刷新截止时间（time.monotonic），否则为 None"""
+        return self._deadline
+
+    def _encode(self, kind: str, text: str) -> str:
+        self.frames += 1
+        if kind == "reasoning":
+            return self._encoder.reasoning(text)
+        return self._encoder.content(text)
+
+    def push(self, kind: str, text: str, now: float) -> str:
+        """加入一条增量（kind 为 "content" 或 "reasoning"），返回需要立即发送的帧（可能为空串）"""
+        self.deltas += 1
+        out = ""
+        if self._parts and kind != self._kind:
+            out = self.flush()
+        if not self._window or kind not in self._started:
+            self._started.add(kind)
+            return out + self._encode(kind, text)
+
+        if not self._parts:
+            self._kind = kind
+            self._deadline = now + self._window
+        self._parts.append(text)
+        self._size += len(text)  # 按字符数近似，避免逐条 encode
+        if self._size >= self._max_bytes or now >= self._deadline:
+            out += self.flush()
+        return out
+
+    def flush(self) -> str:
+        """输出累积的增量（没有则返回空串）"""
+        if not self._parts:
+            return ""
+        text = "".join(self._parts)
+        kind = self._kind
+        self._parts = []
+        self._size = 0
+        self._kind = None
+        self._deadline = None
+        return self._encode(kind, text)
@@ -1,5 +1,10 @@
+import asyncio
+import codecs
 import json
-from typing import Iterator, Dict, Any, Iterable, AsyncIterator
+import re
+import time
+from collections import deque
+from typing import Iterator, Dict, Any, Iterable, AsyncIterator, Callable, List, Optional, Union
 from itertools import chain
 
 def parse_json_array_stream(line_iterator: Iterable[str]) -> Iterator[Dict[str, Any]]:
@@ -253,3 +258,345 @@ async def parse_json_array_stream_async(line_iterator: AsyncIterator[str]) -> As
     if brace_level != 0:
         print(f"警告: JSON流意外结束，括号层级为 {brace_level}，可能数据不完整。")
 
+
+
+# ---------- 字节流解析器（批量扫描） ----------
+
+# 对象内部（字符串外）只关心结构字符；完整的字符串字面量整体跳过，
+# 未闭合的字符串只匹配到起始引号，进入字符串状态
+_STRUCTURAL_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}"]', re.S)
+# 字符串内部只关心结束引号和转义符
+_STRING_SPECIAL_RE = re.compile(r'["\\]')
+# 跨块对象走 raw_decode 快速路径的最大尝试次数，超过后改用扫描，避免大对象反复重解析
+_MAX_RAW_ATTEMPTS = 3
+
+
+class JsonArrayStreamDecoder:
+    """
+    增量解析 JSON 数组流的解码器（按字节块喂入）。
+
+    与逐字符版本不同，对象直接交给 `JSONDecoder.raw_decode` 在 C 层解析；
+    对象跨块时暂存尾部，等下一块到达后重试。重试超过 `_MAX_RAW_ATTEMPTS` 次的大对象
+    退回扫描模式：用预编译正则跳到下一个结构字符，未完成的对象以分片列表保存，
+    闭合时只做一次 join + json.loads。每个字节被解析的次数有上限，整体开销与数据量线性相关。
+
+    用法：
+        decoder = JsonArrayStreamDecoder()
+        for chunk in chunks:
+            for obj in decoder.feed(chunk):
+                ...
+        decoder.close()
+    """
+
+    def __init__(self) -> None:
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._json_decoder = json.JSONDecoder(strict=False)
+        self._in_array = False
+        self._pending_line = ""  # 找到 '[' 之前尚未结束的行
+        self._tail = ""  # 等待下一块后重试 raw_decode 的未闭合对象
+        self._raw_attempts = 0
+        self._pieces: List[str] = []  # 扫描模式下当前对象已跨块的分片
+        self._depth = 0
+        self._in_string = False
+        self._escape_next = False
+
+    def feed(self, data: Union[bytes, str]) -> List[Dict[str, Any]]:
+        """喂入一块数据，返回本块内闭合的所有第一层级对象。"""
+        text = self._text_decoder.decode(data) if isinstance(data, bytes) else data
+        if not text:
+            return []
+        if not self._in_array:
+            text = self._find_array_start(text)
+            if text is None:
+                return []
+        return self._scan(text)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """结束输入，返回残留数据中闭合的对象。
+
+        Raises:
+            ValueError: 如果流中没有出现以 '[' 开始的行。
+        """
+        objects: List[Dict[str, Any]] = []
+        tail = self._text_decoder.decode(b"", final=True)
+        if tail:
+            objects.extend(self.feed(tail))
+        if self._tail:
+            # 不会再有新数据，剩余部分直接交给扫描模式判定是截断还是格式错误
+            self._raw_attempts = _MAX_RAW_ATTEMPTS
+            objects.extend(self._scan(""))
+        if not self._in_array:
+            raise ValueError("数据流不是以一个JSON数组 ( '[' ) 开始。")
+        if self._depth != 0:
+            print(f"警告: JSON流意外结束，括号层级为 {self._depth}，可能数据不完整。")
+        return objects
+
+    def _find_array_start(self, text: str) -> Optional[str]:
+        """逐行寻找以 '[' 开头的行（与按行解析器语义一致），返回其后的剩余文本。"""
+        text = self._pending_line + text
+        pos = 0
+        while True:
+            newline = text.find("\n", pos)
+            line = text[pos:] if newline < 0 else text[pos:newline]
+            stripped = line.lstrip()
+            if stripped.startswith("["):
+                self._in_array = True
+                self._pending_line = ""
+                start = pos + (len(line) - len(stripped)) + 1
+                return text[start:]
+            if newline < 0:
+                # 行尚未结束，等待更多数据
+                self._pending_line = line
+                return None
+            pos = newline + 1
+
+    def _scan(self, text: str) -> List[Dict[str, Any]]:
+        objects: List[Dict[str, Any]] = []
+        if self._tail:
+            text = self._tail + text
+            self._tail = ""
+        n = len(text)
+        pos = 0
+        # 当前对象在本块中的起始位置（跨块延续的对象从 0 开始）
+        seg_start = 0
+
+        while pos < n:
+            if self._escape_next:
+                pos += 1
+                self._escape_next = False
+                continue
+
+            if self._depth == 0:
+                start = text.find("{", pos)
+                if start < 0:
+                    break
+                if self._raw_attempts < _MAX_RAW_ATTEMPTS:
+                    try:
+                        obj, pos = self._json_decoder.raw_decode(text, start)
+                        objects.append(obj)
+                        self._raw_attempts = 0
+                        continue
+                    except json.JSONDecodeError:
+                        # 对象尚未完整到达（或格式错误），暂存等待下一块
+                        self._raw_attempts += 1
+                        self._tail = text[start:]
+                        return objects
+                # 多次重试仍未闭合，从 '{' 之后进入扫描模式
+                self._raw_attempts = 0
+                self._depth = 1
+                seg_start = start
+                pos = start + 1
+                continue
+
+            if self._in_string:
+                match = _STRING_SPECIAL_RE.search(text, pos)
+                if match is None:
+                    pos = n
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape_next = True
+                else:
+                    self._in_string = False
+                continue
+
+            match = _STRUCTURAL_RE.search(text, pos)
+            if match is None:
+                pos = n
+                break
+            pos = match.end()
+            char = match.group()
+            if char[0] == '"':
+                # 单个引号表示字符串在本块内未闭合
+                if len(char) == 1:
+                    self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pieces.append(text[seg_start:pos])
+                    obj_str = "".join(self._pieces)
+                    self._pieces = []
+                    try:
+                        objects.append(json.loads(obj_str, strict=False))
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"解析JSON对象失败: {e}\n内容: {obj_str}") from e
+
+        if self._depth > 0:
+            self._pieces.append(text[seg_start:])
+        return objects
+
+
+def parse_json_array_bytes_stream(chunk_iterator: Iterable[Union[bytes, str]]) -> Iterator[Dict[str, Any]]:
+    """
+    解析由字节块组成的 JSON 数组流（同步版本）。
+
+    Args:
+        chunk_iterator: 一个产生原始字节块的迭代器，例如 `requests.Response.iter_content()`。
+
+    Yields:
+        一个从流中解析出的JSON对象的字典。
+
+    Raises:
+        ValueError: 如果流不是以JSON数组开始，或者对象格式错误。
+    """
+    decoder = JsonArrayStreamDecoder()
+    for chunk in chunk_iterator:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+async def parse_json_array_bytes_stream_async(chunk_iterator: AsyncIterator[Union[bytes, str]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    异步版本：解析由字节块组成的 JSON 数组流。
+
+    与 `parse_json_array_stream_async` 产出相同的对象序列，但直接消费
+    `httpx.Response.aiter_bytes()`，不再逐行、逐字符处理。
+
+    Args:
+        chunk_iterator: 一个产生原始字节块的异步迭代器。
+
+    Yields:
+        一个从流中解析出的JSON对象的字典。
+
+    Raises:
+        ValueError: 如果流不是以JSON数组开始，或者对象格式错误。
+    """
+    decoder = JsonArrayStreamDecoder()
+    async for chunk in chunk_iterator:
+        for obj in decoder.feed(chunk):
+            yield obj
+    for obj in decoder.close():
+        yield obj
+
+
+_EOF = object()
+
+
+class KeepAliveStream:
+    """
+    带保活截止时间的上游对象迭代器。
+
+    整个流只使用一个长期存在的读取任务，与消费方之间通过两个 Event 逐块交接，不经过队列：
+    - 读取任务最多领先消费方一个字节块（按字节块，而不是按对象），交出后等消费方取走才继续读
+    - 一个字节块解析出的对象暂存在 `_ready` 中，消费方不取走就不会继续读上游，
+      客户端变慢时内存占用上限为一个字节块解析出的对象
+    - 每个字节块不再创建新的 Task；等待用 `asyncio.timeout`，超时只取消等待本身，不影响读取任务
+    - 读取不能放在消费方协程里直接等待：保活超时会取消进行中的读取，而 httpcore 在读取被取消时
+      会关闭整个响应，后续数据全部丢失；手动驱动读取协程又会让 httpcore 按任务绑定的
+      读超时（anyio cancel scope）误取消消费方任务。因此保留这一个读取任务
+    - 超过 `interval` 秒没有新数据，或到达调用方设置的 `wake_at`，`__anext__` 返回 None，
+      由调用方决定发送 keep-alive 或刷新缓冲
+
+    用法：
+        stream = KeepAliveStream(r.aiter_bytes(), 15, decoder.feed, decoder.close)
+        try:
+            async for obj in stream:
+                if obj is None:
+                    ...  # 发送 keep-alive
+        finally:
+            await stream.aclose()
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[Any],
+        interval: float,
+        decode: Optional[Callable[[Any], Iterable[Dict[str, Any]]]] = None,
+        finish: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None,
+    ) -> None:
+        self._source = source
+        self._interval = interval
+        self._decode = decode
+        self._finish = finish
+        self._ready: deque = deque()
+        self._reader: Optional[asyncio.Task] = None
+        self._item: Any = None
+        self._error: Optional[BaseException] = None
+        self._has_item = asyncio.Event()  # 读取任务已交出一个字节块（或结束）
+        self._taken = asyncio.Event()  # 消费方已取走，读取任务可以继续读
+        self._exhausted = False
+        self._deadline = time.monotonic() + interval
+        self.wake_at: Optional[float] = None  # 额外的一次性唤醒时间（time.monotonic），例如合并窗口到期
+
+    def __aiter__(self) -> "KeepAliveStream":
+        return self
+
+    async def _read(self) -> None:
+        try:
+            async for item in self._source:
+                self._item = item
+                self._has_item.set()
+                await self._taken.wait()
+                self._taken.clear()
+        except Exception as e:
+            self._error = e
+        self._item = _EOF
+        self._has_item.set()
+
+    async def __anext__(self) -> Optional[Dict[str, Any]]:
+        while True:
+            if self._ready:
+                return self._ready.popleft()
+            if self._exhausted:
+                raise StopAsyncIteration
+
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
+            if not self._has_item.is_set():
+                wake = self._deadline
+                if self.wake_at is not None and self.wake_at < wake:
+                    wake = self.wake_at
+                timeout = wake - time.monotonic()
+                if timeout > 0:
+                    try:
+                        async with asyncio.timeout(timeout):
+                            await self._has_item.wait()
+                    except TimeoutError:
+                        pass
+                if not self._has_item.is_set():
+                    now = time.monotonic()
+                    if now >= self._deadline:
+                        self._deadline = now + self._interval
+                    if self.wake_at is not None and now >= self.wake_at:
+                        self.wake_at = None
+                    return None
+
+            self._has_item.clear()
+            item, self._item = self._item, None
+            if item is _EOF:
+                self._exhausted = True
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                if self._finish is not None:
+                    self._ready.extend(self._finish())
+                continue
+            self._taken.set()
+            self._deadline = time.monotonic() + self._interval
+            if self._decode is None:
+                self._ready.append(item)
+            else:
+                self._ready.extend(self._decode(item))
+
+    async def aclose(self) -> None:
+        """取消读取任务并关闭上游迭代器（调用方自身被取消时照常抛出 CancelledError）"""
+        reader, self._reader = self._reader, None
+        try:
+            if reader is not None and not reader.done():
+                reader.cancel()
+                try:
+                    await reader
+                except asyncio.CancelledError:
+                    # 只忽略读取任务自身的取消；当前任务也在被取消时继续向上抛出
+                    current = asyncio.current_task()
+                    if not reader.cancelled() or (current is not None and current.cancelling()):
+                        raise
+        finally:
+            aclose = getattr(self._source, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass